@@ -0,0 +1,11 @@
+"""
+Quantile multiplicative updates (QMU) for corruption-robust nonnegative matrix factorization.
+
+The solvers live in the submodules, e.g.
+
+    from data_vis.qmu import qmu
+    from data_vis.nmf import nmf
+
+Nothing is imported here, so that a worker importing one module only pays for that module
+(see import_time.py).
+"""
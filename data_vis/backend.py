@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class NumpyBackend:
+    '''
+    Elementwise passes of the fused QMU engine, implemented with NumPy ufuncs writing into
+    preallocated buffers.
+
+    A backend bundles the full-size (m x n) elementwise work of one QMU iteration, so that
+    another array library or a compiled kernel can take it over without changing the
+    algorithm. Subclasses override some or all of the methods; all arrays share one dtype.
+    '''
+
+    name = "numpy"
+
+    def residual(self, D, WH, out):
+        '''
+        Writes the residual magnitudes |D - WH| into out.
+        '''
+        np.subtract(D, WH, out=out)
+        np.abs(out, out=out)
+        return out
+
+    def apply_mask(self, E, threshold, D, WH, M, MD):
+        '''
+        Writes the mask M = (E <= threshold) and the masked data MD = M * D, and masks WH
+        in place.
+        '''
+        np.less_equal(E, threshold, out=M)
+        np.multiply(D, M, out=MD)
+        np.multiply(WH, M, out=WH)
+
+    def mask_product(self, D, WH, threshold, M, MD):
+        '''
+        Same as apply_mask, but computes the residual |D - WH| on the fly instead of
+        reading it from a buffer (used when the threshold did not need the full residual).
+        '''
+        np.subtract(D, WH, out=MD)
+        np.abs(MD, out=MD)
+        np.less_equal(MD, threshold, out=M)
+        np.multiply(D, M, out=MD)
+        np.multiply(WH, M, out=WH)
+
+    def remask(self, WH, M):
+        '''
+        Masks WH in place.
+        '''
+        np.multiply(WH, M, out=WH)
+
+    def squared_error(self, X, WH, out):
+        '''
+        Returns ||X - WH||_F^2, using out as scratch, accumulated in float64.
+        '''
+        np.subtract(X, WH, out=out)
+        if out.dtype == np.float64:
+            return np.vdot(out, out)
+        return np.einsum('ij,ij->', out, out, dtype=np.float64)
+
+
+_BACKENDS = {"numpy": NumpyBackend}
+
+
+def register_backend(name, backend_class):
+    '''
+    Makes a backend class available to qmu(..., backend=name).
+    '''
+    _BACKENDS[name] = backend_class
+
+
+def get_backend(backend):
+    '''
+    Resolves a backend name or instance to a backend instance. "auto" loads the optional
+    accelerated kernels of kernels.py and picks the first available of numba, numexpr and numpy.
+    '''
+    if not isinstance(backend, str):
+        return backend
+    if backend not in _BACKENDS:
+        from . import kernels  # registers whichever accelerated backends are installed
+    if backend == "auto":
+        backend = next(name for name in ("numba", "numexpr", "numpy") if name in _BACKENDS)
+    try:
+        return _BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"Unknown array backend: {backend!r}") from None
@@ -0,0 +1,195 @@
+import numpy as np
+from time import time
+
+from .data_gen import generate_synthetic_matrix
+from .nmf import nmf
+from .qmu import qmu
+from .restarts import nmf_restarts, qmu_restarts
+from .quantile import quantile_threshold
+from .backend import get_backend
+
+
+def benchmark_engines(m=2000, n=1000, r=10, beta=0.05, max_iter=20, engines=("numpy", "fused", "masked", "blocked"), seed=0,
+                      dtype=np.float64, backends=("numpy", "auto")):
+    """
+    Times the QMU engines on the same synthetic corrupted matrix.
+
+    Parameters:
+        m (int): Number of rows of the synthetic matrix.
+        n (int): Number of columns of the synthetic matrix.
+        r (int): Rank used both to generate the data and to fit the model.
+        beta (float): Corruption proportion; the mask quantile is q = 1 - beta.
+        max_iter (int): Number of QMU iterations per engine.
+        engines (tuple): Engine names passed to qmu.
+        seed (int): Random number generator seed for the data and the initialization.
+        dtype (np.dtype): Floating point type of the data and the iteration.
+        backends (tuple): Array backends the "fused" engine is timed with, reported as
+                          "fused[<backend>]". Kernels are compiled before timing.
+
+    Returns:
+        results (dict): Dictionary mapping engine names to a dict with the total wall-clock
+                        time ('wall'), the runtime reported by qmu ('runtime') and the largest
+                        deviation of the final error from the first engine ('max_error_diff').
+    """
+    np.random.seed(seed)
+    D, D_tilde = generate_synthetic_matrix(m, n, r, beta=beta, dtype=dtype)
+
+    runs = []
+    for engine in engines:
+        if engine == "fused":
+            runs += [(f"fused[{get_backend(backend).name}]", engine, backend) for backend in backends]
+        else:
+            runs.append((engine, engine, "numpy"))
+
+    results = {}
+    reference = None
+    for name, engine, backend in runs:
+        if engine == "fused":
+            qmu(D_tilde[:8, :8], D[:8, :8], 1, 2, 1 - beta, seed=seed, engine=engine, dtype=dtype, backend=backend)
+        start_time = time()
+        outputs = qmu(D_tilde, D, max_iter, r, 1 - beta, seed=seed, engine=engine, dtype=dtype, backend=backend)
+        wall = time() - start_time
+        errors = np.array(outputs[3])
+        if reference is None:
+            reference = errors
+        results[name] = {
+            'wall': wall,
+            'runtime': outputs[4],
+            'max_error_diff': float(np.max(np.abs(errors - reference) / reference)),
+        }
+    return results
+
+
+def benchmark_solvers(m=2000, n=1000, r=10, beta=0.05, max_iter=100, solvers=("mu", "amu", "hals", "amu_nesterov",
+                      "hals_nesterov"), target=1e-3, seed=0):
+    """
+    Compares the qmu solvers by cost per iteration and iterations needed to reach an error.
+
+    Parameters:
+        m (int): Number of rows of the synthetic matrix.
+        n (int): Number of columns of the synthetic matrix.
+        r (int): Rank used both to generate the data and to fit the model.
+        beta (float): Corruption proportion; the mask quantile is q = 1 - beta.
+        max_iter (int): Number of QMU iterations per solver.
+        solvers (tuple): Solver names passed to qmu.
+        target (float): Relative error to reach.
+        seed (int): Random number generator seed for the data and the initialization.
+
+    Returns:
+        results (dict): Dictionary mapping solver names to a dict with the runtime reported by
+                        qmu ('runtime'), the final relative error ('final_error'), the first
+                        iteration whose error is at most target ('iterations', None if never)
+                        and the runtime up to that iteration ('time_to_target').
+    """
+    np.random.seed(seed)
+    D, D_tilde = generate_synthetic_matrix(m, n, r, beta=beta)
+
+    results = {}
+    for solver in solvers:
+        outputs = qmu(D_tilde, D, max_iter, r, 1 - beta, seed=seed, history="none", solver=solver)
+        errors = np.array(outputs[3])
+        reached = np.flatnonzero(errors <= target)
+        iterations = int(reached[0]) if len(reached) else None
+        results[solver] = {
+            'runtime': outputs[4],
+            'final_error': float(errors[-1]),
+            'iterations': iterations,
+            'time_to_target': None if iterations is None else outputs[4] * iterations / (len(errors) - 1),
+        }
+    return results
+
+
+def benchmark_quantile(size=10**7, q=0.95, tol=0.005, repeats=3, seed=0):
+    """
+    Times the mask threshold computations on a vector of synthetic residual magnitudes.
+
+    Parameters:
+        size (int): Number of residual entries.
+        q (float): Quantile level.
+        tol (float): Rank error bound for the sampled estimate.
+        repeats (int): Number of timed repetitions; the fastest is reported.
+        seed (int): Random number generator seed.
+
+    Returns:
+        results (dict): Dictionary mapping method names to a dict with the best time ('time')
+                        and the achieved quantile level of the returned threshold ('level').
+    """
+    rng = np.random.default_rng(seed)
+    E = np.abs(rng.standard_normal(size))
+    buffer = np.empty_like(E)
+
+    methods = {
+        'np.quantile': lambda: np.quantile(E, q),
+        'exact': lambda: quantile_threshold(E, q),
+        'exact (buffer)': lambda: quantile_threshold(E, q, buffer=buffer),
+        'sample': lambda: quantile_threshold(E, q, "sample", tol=tol, rng=rng),
+    }
+
+    results = {}
+    for name, func in methods.items():
+        times = []
+        for _ in range(repeats):
+            start_time = time()
+            threshold = func()
+            times.append(time() - start_time)
+        results[name] = {'time': min(times), 'level': float(np.mean(E <= threshold))}
+    return results
+
+
+def benchmark_restarts(m=50, n=40, r=5, beta=0.05, max_iter=100, num_restarts=32, seed=0):
+    """
+    Compares num_restarts sequential nmf/qmu calls with one batched call from restarts.py.
+
+    Parameters:
+        m (int): Number of rows of the synthetic matrix.
+        n (int): Number of columns of the synthetic matrix.
+        r (int): Rank used both to generate the data and to fit the model.
+        beta (float): Corruption proportion; the mask quantile is q = 1 - beta.
+        max_iter (int): Number of iterations per restart.
+        num_restarts (int): Number of random initializations.
+        seed (int): Random number generator seed for the data.
+
+    Returns:
+        results (dict): Dictionary mapping 'nmf' and 'qmu' to a dict with the wall-clock time
+                        of the sequential calls ('sequential') and of the batched call ('batched').
+    """
+    np.random.seed(seed)
+    D, D_tilde = generate_synthetic_matrix(m, n, r, beta=beta)
+    q = 1 - beta
+
+    runs = {
+        'nmf': (lambda k: nmf(D_tilde, D, max_iter, r, seed=k, history="none"),
+                lambda: nmf_restarts(D_tilde, D, max_iter, r, num_restarts, seed=seed)),
+        'qmu': (lambda k: qmu(D_tilde, D, max_iter, r, q, seed=k, history="none"),
+                lambda: qmu_restarts(D_tilde, D, max_iter, r, q, num_restarts, seed=seed)),
+    }
+
+    results = {}
+    for name, (single, batched) in runs.items():
+        start_time = time()
+        for k in range(num_restarts):
+            single(k)
+        sequential = time() - start_time
+        start_time = time()
+        batched()
+        results[name] = {'sequential': sequential, 'batched': time() - start_time}
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark_engines()
+    base = results["numpy"]['wall']
+    for engine, res in results.items():
+        print(f"{engine:>15}: wall {res['wall']:.3f}s  runtime {res['runtime']:.3f}s  "
+              f"speedup {base / res['wall']:.2f}x  max rel. error diff {res['max_error_diff']:.2e}")
+
+    for solver, res in benchmark_solvers().items():
+        reached = "never" if res['iterations'] is None else f"{res['iterations']} it / {res['time_to_target']:.3f}s"
+        print(f"{solver:>15}: runtime {res['runtime']:.3f}s  final error {res['final_error']:.2e}  "
+              f"error 1e-3 reached: {reached}")
+
+    for name, res in benchmark_quantile().items():
+        print(f"{name:>15}: {res['time']:.3f}s  level {res['level']:.4f}")
+
+    for name, res in benchmark_restarts().items():
+        print(f"{name:>4} restarts: sequential {res['sequential']:.3f}s  batched {res['batched']:.3f}s")
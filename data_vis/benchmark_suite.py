@@ -0,0 +1,249 @@
+"""
+Scaling benchmarks for nmf and qmu with saved results.
+
+Sweeps matrix size, rank, quantile level q and corruption proportion beta on synthetic
+data and on the Swimmer dataset, and reports per-phase timings (quantile, mask, W update,
+H update and error, from observers.PhaseTimer), peak memory and iterations per second.
+Results are written as JSON or CSV so two versions can be compared with --compare.
+
+Example:
+    python -m data_vis.benchmark_suite --sizes 1000x500 2000x1000 --ranks 10 20 --output bench.json
+    python -m data_vis.benchmark_suite --sizes 1000x500 --ranks 10 --compare bench.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import platform
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+from .data_gen import generate_synthetic_matrix, load_swimmer_dataset
+from .nmf import nmf
+from .observers import PhaseTimer
+from .qmu import qmu
+from .solvers import SOLVERS
+
+PHASES = ("quantile", "mask", "W", "H", "error")
+FIELDS = ("dataset", "algorithm", "solver", "m", "n", "r", "q", "beta", "max_iter", "wall", "iterations_per_sec",
+          "peak_memory") + tuple(f"time_{phase}" for phase in PHASES) + ("final_error",)
+
+
+def peak_memory(func):
+    """
+    Returns the peak memory in bytes allocated through Python and NumPy while func() runs.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_case(D_tilde, D, max_iter, r, q=None, seed=0, engine="numpy", solver="mu"):
+    """
+    Benchmarks one fit of nmf (q=None) or qmu on the given data.
+
+    Parameters:
+        D_tilde (np.ndarray): Reference data used for error measurement.
+        D (np.ndarray): Training data.
+        max_iter (int): Number of iterations.
+        r (int): Target rank for the factorization.
+        q (float): Quantile level of the mask, or None for plain NMF.
+        seed (int): Random number generator seed.
+        engine (str): QMU engine.
+        solver (str): Solver of nmf and qmu (see solvers.py).
+
+    Returns:
+        result (dict): Wall-clock time of the solver ('wall'), iterations per second of its
+                       reported runtime ('iterations_per_sec'), peak memory in bytes
+                       ('peak_memory'), the per-phase times ('time_<phase>') and the final
+                       relative error ('final_error').
+    """
+    def fit(profiler=None):
+        if q is None:
+            return nmf(D_tilde, D, max_iter, r, seed=seed, history="none", profiler=profiler, solver=solver)
+        return qmu(D_tilde, D, max_iter, r, q, seed=seed, engine=engine, history="none", profiler=profiler,
+                   solver=solver)
+
+    profiler = PhaseTimer()
+    start_time = perf_counter()
+    outputs = fit(profiler)
+    wall = perf_counter() - start_time
+    iterations = len(outputs[3]) - 1
+
+    result = {
+        'wall': wall,
+        'iterations_per_sec': iterations / outputs[4] if outputs[4] > 0 else float('inf'),
+        'peak_memory': peak_memory(fit),
+        'final_error': float(outputs[3][-1]),
+    }
+    result.update({f"time_{phase}": profiler.totals.get(phase, 0.0) for phase in PHASES})
+    return result
+
+
+def run_suite(sizes=((1000, 500),), ranks=(10,), qs=(0.95,), betas=(0.05,), datasets=("synthetic", "swimmer"),
+              algorithms=("nmf", "qmu"), max_iter=50, seed=0, engine="numpy", solvers=("mu",), path=None):
+    """
+    Runs benchmark_case over the grid of datasets, sizes, ranks, q and beta.
+
+    Parameters:
+        sizes (tuple): (m, n) shapes of the synthetic matrices. Ignored for the Swimmer data.
+        ranks (tuple): Ranks used both to generate the synthetic data and to fit the model.
+        qs (tuple): Quantile levels for qmu.
+        betas (tuple): Corruption proportions.
+        datasets (tuple): "synthetic" and/or "swimmer".
+        algorithms (tuple): "nmf" and/or "qmu".
+        max_iter (int): Number of iterations per fit.
+        seed (int): Random number generator seed for the data and the initialization.
+        engine (str): QMU engine.
+        solvers (tuple): Solvers of nmf and qmu to run each case with.
+        path (str): Location of Swimmer.mat, see data_gen.load_swimmer_dataset.
+
+    Returns:
+        rows (list): One dict per benchmark case with the keys in FIELDS.
+    """
+    rows = []
+    for dataset, beta in itertools.product(datasets, betas):
+        shapes = sizes if dataset == "synthetic" else [None]
+        for shape, r in itertools.product(shapes, ranks):
+            np.random.seed(seed)
+            if dataset == "synthetic":
+                D, D_tilde = generate_synthetic_matrix(shape[0], shape[1], r, beta=beta)
+            else:
+                D, D_tilde = load_swimmer_dataset(beta=beta, path=path)
+            m, n = D.shape
+
+            cases = [(algorithm, q, solver) for algorithm in algorithms
+                     for q in ([None] if algorithm == "nmf" else qs) for solver in solvers]
+            for algorithm, q, solver in cases:
+                row = {'dataset': dataset, 'algorithm': algorithm, 'solver': solver, 'm': m, 'n': n, 'r': r,
+                       'q': q, 'beta': beta, 'max_iter': max_iter}
+                row.update(benchmark_case(D_tilde, D, max_iter, r, q, seed, engine, solver))
+                rows.append(row)
+                print(format_row(row), flush=True)
+    return rows
+
+
+def format_row(row):
+    """
+    Formats one benchmark result as a single line.
+    """
+    phases = "  ".join(f"{phase} {row[f'time_{phase}']:.3f}s" for phase in PHASES)
+    q = "-" if row['q'] is None else f"{row['q']:.2f}"
+    return (f"{row['dataset']:>9} {row['algorithm']:>3} {row['solver']:>13} {row['m']}x{row['n']} r={row['r']} q={q} "
+            f"beta={row['beta']:.2f}: {row['wall']:.3f}s  {row['iterations_per_sec']:.1f} it/s  "
+            f"peak {row['peak_memory'] / 2**20:.1f} MiB  [{phases}]")
+
+
+def environment():
+    """
+    Returns a description of the machine and library versions the results were measured on.
+    """
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def save_results(rows, path):
+    """
+    Saves benchmark rows to path, as CSV if it ends in '.csv' and as JSON otherwise.
+    The JSON file also records the environment.
+    """
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as file:
+            json.dump({'environment': environment(), 'results': rows}, file, indent=2)
+
+
+def load_results(path):
+    """
+    Loads benchmark rows saved by save_results.
+    """
+    if not path.endswith(".csv"):
+        with open(path) as file:
+            return json.load(file)['results']
+    with open(path, newline="") as file:
+        rows = list(csv.DictReader(file))
+    for row in rows:
+        for key, value in row.items():
+            if key not in ("dataset", "algorithm", "solver"):
+                row[key] = None if value == "" else float(value)
+    return rows
+
+
+def compare_results(baseline, current, tolerance=0.1):
+    """
+    Matches benchmark rows by their parameters and reports the cases that got slower.
+
+    Parameters:
+        baseline (list): Rows of the reference run.
+        current (list): Rows of the new run.
+        tolerance (float): Relative slowdown of the wall-clock time that counts as a regression.
+
+    Returns:
+        regressions (list): (row, baseline wall, current wall) for each case whose wall-clock
+                            time grew by more than the tolerance.
+    """
+    def key(row):
+        row = dict(row, solver=row.get('solver') or "mu")
+        return tuple(str(row[field]) if field in ("dataset", "algorithm", "solver") else
+                     (None if row[field] is None else float(row[field]))
+                     for field in ("dataset", "algorithm", "solver", "m", "n", "r", "q", "beta", "max_iter"))
+
+    reference = {key(row): float(row['wall']) for row in baseline}
+    regressions = []
+    for row in current:
+        before = reference.get(key(row))
+        if before is not None and row['wall'] > (1 + tolerance) * before:
+            regressions.append((row, before, row['wall']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for nmf and qmu.")
+    parser.add_argument("--sizes", nargs="+", default=["1000x500"], help="synthetic shapes as MxN")
+    parser.add_argument("--ranks", nargs="+", type=int, default=[10])
+    parser.add_argument("--qs", nargs="+", type=float, default=[0.95])
+    parser.add_argument("--betas", nargs="+", type=float, default=[0.05])
+    parser.add_argument("--datasets", nargs="+", choices=["synthetic", "swimmer"], default=["synthetic", "swimmer"])
+    parser.add_argument("--algorithms", nargs="+", choices=["nmf", "qmu"], default=["nmf", "qmu"])
+    parser.add_argument("--max-iter", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", default="numpy", help="qmu engine")
+    parser.add_argument("--solvers", nargs="+", default=["mu"], choices=SOLVERS)
+    parser.add_argument("--output", help="write results to this .json or .csv file")
+    parser.add_argument("--compare", help="earlier results to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported by --compare")
+    parser.add_argument("--path", help="Swimmer.mat to load instead of the packaged copy")
+    args = parser.parse_args(argv)
+
+    sizes = [tuple(int(k) for k in size.lower().split("x")) for size in args.sizes]
+    rows = run_suite(sizes, args.ranks, args.qs, args.betas, args.datasets, args.algorithms,
+                     args.max_iter, args.seed, args.engine, args.solvers, args.path)
+    if args.output:
+        save_results(rows, args.output)
+
+    if args.compare:
+        regressions = compare_results(load_results(args.compare), rows, args.tolerance)
+        for row, before, after in regressions:
+            print(f"slower: {format_row(row)}  (was {before:.3f}s, now {after:.3f}s)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+"""
+Consistency check of the qmu engines against the reference "numpy" engine.
+
+Every engine is run on the Swimmer data and on synthetic data for each dtype, mask mode
+and mask refresh interval, and its error curve is compared with the "numpy" engine's
+curve for the same configuration. The check fails if a curve is not finite or deviates by
+more than the tolerance of its dtype.
+
+Example:
+    python -m data_vis.check_engines --max-iter 100
+"""
+import argparse
+import itertools
+
+import numpy as np
+
+from .data_gen import generate_synthetic_matrix, load_swimmer_dataset
+from .qmu import qmu
+
+ENGINES = ("fused", "masked", "blocked")
+MASK_MODES = ("global", "row", "column", "tile")
+# Relative tolerance on the error curves, per dtype.
+RTOL = {np.dtype(np.float64): 1e-8, np.dtype(np.float32): 1e-2}
+
+
+def compare_engines(D_tilde, D, r, q, max_iter, dtype=np.float64, mask_mode="global", mask_every=1,
+                    tile_shape=(16, 16), seed=0, engines=ENGINES):
+    """
+    Runs qmu with each engine and the "numpy" engine under the same configuration.
+
+    Returns:
+        deviations (dict): Maps each engine that supports the configuration to the largest
+                           relative deviation of its error curve from the "numpy" engine's
+                           (np.inf if its curve is not finite or has a different length).
+    """
+    def run(engine):
+        return np.array(qmu(D_tilde, D, max_iter, r, q, seed=seed, engine=engine, history="none", dtype=dtype,
+                            mask_mode=mask_mode, tile_shape=tile_shape, mask_every=mask_every)[3])
+
+    reference = run("numpy")
+    deviations = {}
+    for engine in engines:
+        if engine == "blocked" and (mask_mode == "column" or mask_every != 1):
+            continue
+        errors = run(engine)
+        if errors.shape != reference.shape or not np.all(np.isfinite(errors)):
+            deviations[engine] = np.inf
+        else:
+            deviations[engine] = float(np.max(np.abs(errors - reference) / np.maximum(reference, 1e-12)))
+    return deviations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the qmu engines with the reference engine.")
+    parser.add_argument("--max-iter", type=int, default=50)
+    parser.add_argument("--q", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    np.random.seed(1)
+    datasets = {'swimmer': load_swimmer_dataset(beta=0.05, corruption_scale=5) + (17,),
+                'synthetic': generate_synthetic_matrix(200, 150, 5, beta=0.05) + (5,)}
+
+    failed = False
+    for (name, (D, D_tilde, r)), dtype, mask_mode, mask_every in itertools.product(
+            datasets.items(), (np.float64, np.float32), MASK_MODES, (1, 3)):
+        deviations = compare_engines(D_tilde, D, r, args.q, args.max_iter, dtype, mask_mode, mask_every,
+                                     seed=args.seed)
+        rtol = RTOL[np.dtype(dtype)]
+        bad = [engine for engine, deviation in deviations.items() if not deviation <= rtol]
+        failed = failed or bool(bad)
+        results = "  ".join(f"{engine} {deviation:.1e}" for engine, deviation in deviations.items())
+        print(f"{name:>9} {np.dtype(dtype).name} {mask_mode:>6} every {mask_every}: {results}"
+              + (f"  FAILED: {', '.join(bad)}" if bad else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,52 @@
+import os
+
 import numpy as np
 
+# Environment variables read by the common BLAS/OpenMP runtimes when NumPy is imported,
+# and by numexpr and Numba's parallel kernels.
+THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "BLIS_NUM_THREADS",
+               "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+
+def issparse(X):
+    '''
+    Returns True if X is a scipy.sparse matrix or array, without importing scipy.
+    '''
+    return hasattr(X, "tocsr") and hasattr(X, "nnz")
+
+
+def dense_rows(X, start, stop, dtype=np.float64):
+    '''
+    Returns rows start:stop of X as a dense np.ndarray of the given dtype. X can be an
+    np.ndarray, an np.memmap, an HDF5 dataset, or a scipy.sparse matrix (CSR is the cheap
+    case). If X already has that dtype the result may be a view and must not be modified.
+    '''
+    block = X[start:min(stop, X.shape[0])]
+    if issparse(block):
+        block = block.toarray()
+    return np.asarray(block, dtype=dtype)
+
+
+def limit_threads(threads):
+    '''
+    Caps every variable of THREAD_VARS at threads in this process's environment, which
+    spawned worker processes inherit, and returns the previous values for restore_environment.
+    '''
+    saved = {var: os.environ.get(var) for var in THREAD_VARS}
+    os.environ.update({var: str(threads) for var in THREAD_VARS})
+    return saved
+
+
+def restore_environment(saved):
+    '''
+    Restores the environment variables saved by limit_threads, removing those that were unset.
+    '''
+    for var, value in saved.items():
+        if value is None:
+            os.environ.pop(var, None)
+        else:
+            os.environ[var] = value
+
 
 def relative_error(X, W, H):
     '''
@@ -18,3 +65,120 @@ def relative_error(X, W, H):
     error_norm = np.linalg.norm(X - W @ H, 'fro')**2
     ref_norm = np.linalg.norm(X, 'fro')**2
     return error_norm / (ref_norm + epsilon)
+
+
+def score_mask(M, support):
+    '''
+    Scores a QMU mask against the true corruption support, reading M only at the
+    corrupted entries plus one count of its zeros.
+
+    Parameters:
+        M (np.ndarray): Mask returned by qmu, 0 on the excluded entries.
+        support (np.ndarray): Flat (row-major) indices of the corrupted entries, as
+                              returned by data_gen.corrupt_matrix(..., return_support=True).
+
+    Returns:
+        recall (float): Fraction of the corrupted entries that the mask excludes.
+        precision (float): Fraction of the excluded entries that are corrupted.
+    '''
+    flat = M.reshape(-1)
+    caught = np.count_nonzero(flat[support] == 0)
+    excluded = flat.size - np.count_nonzero(flat)
+    recall = caught / len(support) if len(support) else 1.0
+    precision = caught / excluded if excluded else 1.0
+    return recall, precision
+
+
+class RelativeErrorTracker:
+    '''
+    Evaluates relative_error(X, W, H) repeatedly for a fixed reference X without
+    forming the m x n residual X - W @ H.
+
+    X may be a scipy.sparse matrix, or an out-of-core matrix such as an HDF5 dataset,
+    which is then read in row chunks. ||X||_F^2 is computed once. Each call uses the expansion
+        ||X - WH||_F^2 = ||X||_F^2 - 2 <W^T X, H> + <W^T W, H H^T>,
+    where the Gram term costs O((m + n) r^2). The cross term needs W^T X, which the
+    multiplicative H update already computes when X is the training data; pass it in
+    as WtX to reuse it, otherwise it is formed here (r x n, no m x n memory).
+
+    When the residual is tiny compared to ||X||_F^2 the expansion loses accuracy to
+    cancellation, so the error is recomputed exactly in row chunks of X. All sums are
+    accumulated in float64, also for float32 data and factors, and rtol is raised to
+    100 machine epsilons of the data's dtype.
+
+    Parameters:
+        X (np.ndarray): Reference data (can be corrupted or uncorrupted).
+        rtol (float): Fall back to the exact path when the expanded residual is below
+                      rtol times the sum of the positive terms.
+        chunk_size (int): Number of rows of X per block in the exact path.
+    '''
+
+    def __init__(self, X, rtol=1e-8, chunk_size=1024):
+        self.X = X
+        self.rtol = rtol
+        if np.issubdtype(X.dtype, np.floating):
+            self.rtol = max(rtol, 100 * np.finfo(X.dtype).eps)
+        self.chunk_size = chunk_size
+        self.blocked = not issparse(X) and not isinstance(X, np.ndarray)
+        if issparse(X):
+            self.ref_norm = X.multiply(X).sum(dtype=np.float64)
+        elif self.blocked or X.dtype != np.float64:
+            self.ref_norm = sum(np.vdot(X_b, X_b) for _, X_b in self._chunks())
+        else:
+            self.ref_norm = np.vdot(X, X)
+
+    def __call__(self, W, H, WtX=None):
+        '''
+        Returns the relative error ||X - W @ H||_F^2 / ||X||_F^2.
+
+        Parameters:
+            W (np.ndarray): Dictionary matrix.
+            H (np.ndarray): Representation matrix.
+            WtX (np.ndarray): Optional precomputed W.T @ X.
+        '''
+        epsilon = 1e-10
+        if WtX is None and self.blocked:
+            WtX = sum(W[start:start + len(X_b)].T @ X_b for start, X_b in self._chunks())
+        elif WtX is None:
+            WtX = (self.X.T @ W).T
+        cross = np.vdot(WtX.astype(np.float64, copy=False), H.astype(np.float64, copy=False))
+        gram = np.vdot((W.T @ W).astype(np.float64, copy=False), (H @ H.T).astype(np.float64, copy=False))
+        error_norm = self.ref_norm - 2 * cross + gram
+
+        if error_norm <= self.rtol * (self.ref_norm + gram):
+            error_norm = self.exact_error_norm(W, H)
+        return error_norm / (self.ref_norm + epsilon)
+
+    def batch(self, W, H, WtX=None):
+        '''
+        Returns the relative errors of K stacked factorizations as an array of shape (K,).
+
+        Parameters:
+            W (np.ndarray): Stacked dictionary matrices of shape (K, m, r).
+            H (np.ndarray): Stacked representation matrices of shape (K, r, n).
+            WtX (np.ndarray): Optional precomputed stacked W^T X of shape (K, r, n).
+        '''
+        epsilon = 1e-10
+        if WtX is None:
+            WtX = np.stack([(self.X.T @ W_k).T for W_k in W])
+        cross = np.einsum('kij,kij->k', WtX, H, dtype=np.float64)
+        gram = np.einsum('kij,kij->k', W.transpose(0, 2, 1) @ W, H @ H.transpose(0, 2, 1), dtype=np.float64)
+        error_norm = self.ref_norm - 2 * cross + gram
+
+        for k in np.flatnonzero(error_norm <= self.rtol * (self.ref_norm + gram)):
+            error_norm[k] = self.exact_error_norm(W[k], H[k])
+        return error_norm / (self.ref_norm + epsilon)
+
+    def exact_error_norm(self, W, H):
+        '''
+        Computes ||X - W @ H||_F^2 exactly, one block of chunk_size rows at a time.
+        '''
+        error_norm = 0.0
+        for start, X_b in self._chunks():
+            R = X_b - W[start:start + len(X_b)] @ H
+            error_norm += np.vdot(R, R)
+        return error_norm
+
+    def _chunks(self):
+        for start in range(0, self.X.shape[0], self.chunk_size):
+            yield start, dense_rows(self.X, start, start + self.chunk_size)
@@ -8,11 +8,20 @@ def plot_experiment(errors, log_y_axis=False, runtimes=None,
 
     Parameters:
         errors (dict): Dictionary mapping method labels (str) to numpy arrays of shape
-                       (num_runs, num_iterations+1) containing relative error values.
+                       (num_runs, num_iterations+1) containing relative error values, or a
+                       results_store.ResultsStore (or its directory), whose curves are then
+                       loaded one label at a time.
         log_y_axis (bool): If True, sets the y-axis to a logarithmic scale.
-        runtimes (dict): Dictionary mapping method labels to list of experiment runtimes
+        runtimes (dict): Dictionary mapping method labels to list of experiment runtimes.
+                         Read from the store when errors is a store.
         y_lab (str): Label for the y-axis (supports LaTeX formatting).
     """
+    if isinstance(errors, str):
+        from .results_store import ResultsStore
+        errors = ResultsStore(errors)
+    if runtimes is None and hasattr(errors, 'runtimes'):
+        runtimes = errors.runtimes()
+
     plt.style.use('ggplot')
     plt.rcParams["figure.figsize"] = (19, 11)
     plt.rcParams["font.size"] = 32
@@ -24,8 +33,6 @@ def plot_experiment(errors, log_y_axis=False, runtimes=None,
     plt.rcParams['text.latex.preamble'] = r'\usepackage{amsmath}'
 
     labels = list(errors.keys())
-    num_iterations = errors[labels[0]].shape[1]
-    domain = range(num_iterations)
 
     dashes = [
         [1, 0],      # Solid
@@ -41,6 +48,8 @@ def plot_experiment(errors, log_y_axis=False, runtimes=None,
 
     for i, label in enumerate(labels):
         data_matrix = errors[label]
+        num_iterations = data_matrix.shape[1]
+        domain = range(num_iterations)
         mean_error = np.mean(data_matrix, axis=0)
         min_error = np.min(data_matrix, axis=0)
         max_error = np.max(data_matrix, axis=0)
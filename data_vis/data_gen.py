@@ -1,9 +1,7 @@
 import numpy as np
-import scipy.io
-import matplotlib.pylab as plt
 import os
 
-def corrupt_matrix(D_tilde, beta=0.1, corruption_scale=1e6):
+def corrupt_matrix(D_tilde, beta=0.1, corruption_scale=1e6, rng=None, inplace=False, return_support=False):
     """
     Generates a corrupted data matrix D from an uncorrupted data matrix D_tilde.
 
@@ -14,73 +12,215 @@ def corrupt_matrix(D_tilde, beta=0.1, corruption_scale=1e6):
     are corrupted by adding noise drawn from the absolute value of a Gaussian distribution,
     i.e., |N(0, corruption_scale^2)|, ensuring nonnegative noise.
 
+    Without rng the entries and noise are drawn from the global np.random state exactly as
+    in earlier versions, so seeded experiments reproduce. With a Generator (or a seed) the
+    corrupted entries are drawn with sample_support, which needs O(beta * m * n) memory
+    instead of a permutation of all m * n indices.
+
     Parameters:
         D_tilde (np.ndarray): The original, uncorrupted data matrix.
         beta (float): The fraction of entries to corrupt (0 < beta < 1).
         corruption_scale (float): The standard deviation of the noise, determining the magnitude of corruption.
+        rng (np.random.Generator or int): Random generator or seed; None uses np.random.
+        inplace (bool): If True, add the corruption to D_tilde itself instead of a copy.
+        return_support (bool): If True, also return the corrupted entries.
 
     Returns:
         D (np.ndarray): The corrupted data matrix.
+        support (np.ndarray): Only with return_support: sorted flat (row-major) indices of
+                              the corrupted entries, e.g. for scoring a mask M with
+                              M.ravel()[support].
     """
     m, n = D_tilde.shape
     total_elements = m * n
     num_corrupted = int(total_elements * beta)
 
-    # Generate nonnegative noise: absolute value of a Gaussian random variable
-    noise = np.abs(corruption_scale * np.random.randn(num_corrupted))
+    if rng is None:
+        # Generate nonnegative noise: absolute value of a Gaussian random variable
+        noise = np.abs(corruption_scale * np.random.randn(num_corrupted))
 
-    # Create a copy of D_tilde and flatten it for easier indexing
-    D_flat = D_tilde.copy().flatten()
+        # Randomly select indices to corrupt
+        support = np.random.choice(total_elements, size=num_corrupted, replace=False)
+    else:
+        rng = np.random.default_rng(rng)
+        support = sample_support(total_elements, num_corrupted, rng)
+        noise = _corruption_noise(rng, num_corrupted, corruption_scale, D_tilde.dtype)
 
-    # Randomly select indices to corrupt
-    corrupt_indices = np.random.choice(total_elements, size=num_corrupted, replace=False)
+    # Add noise to the selected entries, through a flat view when D is contiguous.
+    D = D_tilde if inplace else D_tilde.copy()
+    if D.flags.c_contiguous:
+        D.reshape(-1)[support] += noise
+    else:
+        D[np.divmod(support, n)] += noise
 
-    # Add noise to the selected entries
-    D_flat[corrupt_indices] += noise
+    if return_support:
+        return D, np.sort(support)
+    return D
 
-    # Reshape back to the original matrix shape
-    D = D_flat.reshape(m, n)
 
-    return D
+def sample_support(N, k, rng):
+    """
+    Draws k distinct indices from range(N) uniformly at random, returned sorted.
+
+    Instead of permuting all N indices, batches of independent draws are merged until k
+    distinct values are collected, and a uniform subset of k of them is kept. By symmetry
+    every k-subset is equally likely. Memory is O(k); for k > N / 2 the complement is
+    drawn instead.
+
+    Parameters:
+        N (int): Size of the population.
+        k (int): Number of indices to draw (0 <= k <= N).
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        support (np.ndarray): Sorted int64 array of k distinct indices.
+    """
+    if k > N // 2:
+        keep = np.ones(N, dtype=bool)
+        keep[sample_support(N, N - k, rng)] = False
+        return np.flatnonzero(keep)
+
+    support = _sorted_unique(rng.integers(0, N, size=k))
+    while len(support) < k:
+        missing = k - len(support)
+        # Expected number of collisions is about k^2 / N; overdraw a little.
+        draws = rng.integers(0, N, size=missing + missing * k // max(N - k, 1) + 16)
+        support = _sorted_unique(np.concatenate([support, draws]))
+    if len(support) > k:
+        support = np.sort(rng.choice(support, size=k, replace=False))
+    return support
+
 
+def _sorted_unique(a):
+    """
+    Sorts the integer array a in place and returns its distinct values (np.unique without
+    the extra bookkeeping, which is far slower on millions of entries).
+    """
+    a.sort()
+    keep = np.empty(len(a), dtype=bool)
+    keep[:1] = True
+    np.not_equal(a[1:], a[:-1], out=keep[1:])
+    return a[keep]
+
+
+def _corruption_noise(rng, size, corruption_scale, dtype):
+    """
+    |N(0, corruption_scale^2)| noise of the given floating point dtype.
+    """
+    noise = rng.standard_normal(size, dtype=np.float32 if dtype == np.float32 else np.float64)
+    np.abs(noise, out=noise)
+    noise *= corruption_scale
+    return noise
 
-def generate_synthetic_matrix(m, n, r, beta=0, corruption_scale=1e6):
+
+def generate_synthetic_matrix(m, n, r, beta=0, corruption_scale=1e6, dtype=np.float64, rng=None,
+                              return_support=False):
     """
     Generates a synthetic data matrix D_tilde that is exactly factorizable as
         D_tilde = W_tilde @ H_tilde,
     where W_tilde and H_tilde have nonnegative integer entries drawn uniformly from {0, ..., 99}.
 
+    The product is formed in floating point, where it is exact for these integer entries
+    (below 2^53), so it runs on BLAS instead of a dense integer matmul.
+
     Parameters:
         m (int): Number of rows in D_tilde.
         n (int): Number of columns in D_tilde.
         r (int): Target rank (latent dimensionality) of the factorization.
         beta (float): Proportion of matrix entries to be corrupted.
         corruption_scale (float): Size of corruptions to be added.
+        dtype (np.dtype): Floating point type of the returned matrices.
+        rng (np.random.Generator or int): Random generator or seed for the factors and the
+                                          corruption; None uses the global np.random state.
+        return_support (bool): If True, also return the corrupted entries (see corrupt_matrix).
 
     Returns:
         D (np.ndarray): The corrupted data matrix.
         D_tilde (np.ndarray): The uncorrupted synthetic data matrix.
-    
+        support (np.ndarray): Only with return_support: sorted flat indices of the
+                              corrupted entries.
     """
+    if rng is not None:
+        rng = np.random.default_rng(rng)
+
     # Generate factor matrices using the paper's notation.
-    W_tilde = np.abs(np.random.randint(0, high=100, size=(m, r)))
-    H_tilde = np.abs(np.random.randint(0, high=100, size=(r, n)))
+    W_tilde, H_tilde = _synthetic_factors(m, n, r, rng)
 
     # Form the uncorrupted data matrix D_tilde.
-    D_tilde = W_tilde @ H_tilde
-    D_tilde = D_tilde.astype(float)  # Convert to float to allow for future noise addition
+    D_tilde = (W_tilde @ H_tilde).astype(dtype, copy=False)
 
     D = D_tilde
+    support = np.empty(0, dtype=np.int64)
     if beta > 0:
-        D = corrupt_matrix(D_tilde, beta, corruption_scale=corruption_scale)
+        D, support = corrupt_matrix(D_tilde, beta, corruption_scale=corruption_scale, rng=rng,
+                                    return_support=True)
 
+    if return_support:
+        return D, D_tilde, support
     return D, D_tilde
 
 
-def load_swimmer_dataset(beta=0, corruption_scale=1e6, display=False):
+def _synthetic_factors(m, n, r, rng=None):
+    """
+    Integer-valued factors W_tilde (m x r) and H_tilde (r x n) as float64 arrays, drawn
+    from rng (a Generator) or from the global np.random state.
+    """
+    if rng is None:
+        W_tilde = np.random.randint(0, high=100, size=(m, r))
+        H_tilde = np.random.randint(0, high=100, size=(r, n))
+    else:
+        W_tilde = rng.integers(0, 100, size=(m, r))
+        H_tilde = rng.integers(0, 100, size=(r, n))
+    return W_tilde.astype(np.float64), H_tilde.astype(np.float64)
+
+
+def synthetic_blocks(m, n, r, beta=0, corruption_scale=1e6, block_rows=None, rng=None, dtype=np.float64):
+    """
+    Lazily generates a synthetic corrupted matrix in row blocks, for sizes that do not
+    fit in memory (the blocks can be written to an np.memmap and opened with open_matrix).
+
+    The factors and the sorted corruption support are drawn up front (O((m + n) r + beta m n)
+    memory); each block is formed only when requested. With the same Generator seed the
+    concatenated blocks equal generate_synthetic_matrix(m, n, r, beta, ..., rng=seed).
+
+    Parameters:
+        m (int): Number of rows.
+        n (int): Number of columns.
+        r (int): Rank of the uncorrupted matrix.
+        beta (float): Proportion of matrix entries to be corrupted.
+        corruption_scale (float): Size of corruptions to be added.
+        block_rows (int): Rows per block. Defaults to about 2^20 entries per block.
+        rng (np.random.Generator or int): Random generator or seed.
+        dtype (np.dtype): Floating point type of the blocks.
+
+    Yields:
+        start (int): Index of the block's first row.
+        D_b (np.ndarray): Rows start:start + block_rows of the corrupted matrix.
+        D_tilde_b (np.ndarray): The same rows of the uncorrupted matrix.
+        support_b (np.ndarray): Sorted flat indices, into the full m x n matrix, of the
+                                corrupted entries in this block.
+    """
+    rng = np.random.default_rng(rng)
+    if block_rows is None:
+        block_rows = max(1, (1 << 20) // n)
+    W_tilde, H_tilde = _synthetic_factors(m, n, r, rng)
+    support = sample_support(m * n, int(m * n * beta), rng) if beta > 0 else np.empty(0, dtype=np.int64)
+
+    for start in range(0, m, block_rows):
+        stop = min(start + block_rows, m)
+        D_tilde_b = (W_tilde[start:stop] @ H_tilde).astype(dtype, copy=False)
+        lo, hi = np.searchsorted(support, [start * n, stop * n])
+        support_b = support[lo:hi]
+        # Noise is drawn block by block in support order, the same stream corrupt_matrix uses.
+        noise = _corruption_noise(rng, hi - lo, corruption_scale, D_tilde_b.dtype)
+        D_b = D_tilde_b.copy()
+        D_b.reshape(-1)[support_b - start * n] += noise
+        yield start, D_b, D_tilde_b, support_b
+
+
+def load_swimmer_dataset(beta=0, corruption_scale=1e6, display=False, dtype=np.float64, path=None):
     """
-    Loads the Swimmer dataset from the 'Swimmer.mat' file.
-    Ensure 'Swimmer.mat' is in the working directory before calling.
+    Loads the Swimmer dataset from the 'Swimmer.mat' file shipped with the package.
 
     In the .mat file, the data is stored under the key 'X'. Optionally, two sample images
     (images 17 and 170) can be displayed.
@@ -89,20 +229,26 @@ def load_swimmer_dataset(beta=0, corruption_scale=1e6, display=False):
         beta (float): Proportion of matrix entries to be corrupted
         corruption_scale (float): Size of corruptions to be added
         display (bool): If True, displays two sample images from the dataset.
+        dtype (np.dtype): Floating point type of the returned matrices.
+        path (str): Location of Swimmer.mat. Defaults to the copy installed with the package.
 
     Returns:
         D (np.ndarray): The data matrix from the Swimmer dataset, with corruptions.
         D_tilde (np.ndarray): The data matrix from the Swimmer dataset.
     """
-    mat_path = os.path.join(os.path.dirname(__file__), "../data/Swimmer.mat")
+    import scipy.io
+
+    mat_path = path or os.path.join(os.path.dirname(__file__), "Swimmer.mat")
     mat = scipy.io.loadmat(os.path.abspath(mat_path))
-    D_tilde = mat['X'].astype(float)
+    D_tilde = mat['X'].astype(dtype)
     D = D_tilde
 
     if beta > 0:
         D = corrupt_matrix(D_tilde, beta, corruption_scale=corruption_scale)
 
     if display:
+        import matplotlib.pylab as plt
+
         pic17 = np.reshape(D_tilde[:, 17], (11, 20))
         pic170 = np.reshape(D_tilde[:, 170], (11, 20))
 
@@ -121,4 +267,31 @@ def load_swimmer_dataset(beta=0, corruption_scale=1e6, display=False):
         plt.xticks([])
         plt.yticks([])
 
-    return D, D_tilde
\ No newline at end of file
+    return D, D_tilde
+
+
+def open_matrix(path, shape=None, dtype=np.float64, dataset='X'):
+    """
+    Opens a data matrix stored on disk without reading it into memory, for use with
+    the out-of-core ("blocked") QMU engine.
+
+    Parameters:
+        path (str): File to open. '.npy' files are memory-mapped with np.load, '.h5' and
+                    '.hdf5' files are opened with h5py, and anything else is treated as a
+                    raw binary array and memory-mapped with np.memmap.
+        shape (tuple): Matrix shape (m, n); required for raw binary files.
+        dtype (np.dtype): Element type of raw binary files.
+        dataset (str): Name of the dataset inside an HDF5 file.
+
+    Returns:
+        D (np.memmap or h5py.Dataset): Read-only, row-sliceable view of the matrix.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return np.load(path, mmap_mode='r')
+    if ext in ('.h5', '.hdf5'):
+        import h5py
+        return h5py.File(path, 'r')[dataset]
+    if shape is None:
+        raise ValueError("shape is required to open a raw binary matrix")
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+
+
+class DatasetCache:
+    '''
+    Content-keyed cache of generated datasets (D, D_tilde), shared between the labels and
+    runs of an experiment sweep.
+
+    A dataset is identified by the generator function, its keyword parameters and a seed.
+    It is generated once, with NumPy's global random state seeded from that seed and then
+    restored, so a hit and a miss leave the caller's random stream in the same state.
+    Cached arrays are marked read-only.
+
+    Parameters:
+        max_bytes (int): Budget of the in-memory LRU. The least recently used datasets are
+                         evicted to stay under it; a dataset larger than the budget is not
+                         kept in memory.
+        directory (str): Optional directory of an on-disk .npy store, consulted after the
+                         in-memory LRU. It is shared between processes, e.g. the workers
+                         of run_experiments(..., n_jobs=k).
+    '''
+
+    def __init__(self, max_bytes=1 << 30, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, data_gen_func, data_params, seed):
+        '''
+        Returns the dataset data_gen_func(**data_params) generated under the given seed.
+
+        Parameters:
+            data_gen_func (function): Data generation function returning (D, D_tilde).
+            data_params (dict): Keyword arguments for data_gen_func.
+            seed (int or np.random.SeedSequence): Seed the dataset is generated under.
+
+        Returns:
+            D (np.ndarray): Read-only corrupted data matrix.
+            D_tilde (np.ndarray): Read-only uncorrupted data matrix.
+        '''
+        key = dataset_key(data_gen_func, data_params, seed)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        dataset = self._load(key)
+        if dataset is None:
+            self.misses += 1
+            state = np.random.get_state()
+            try:
+                np.random.seed(_legacy_seed(seed))
+                dataset = data_gen_func(**data_params)
+            finally:
+                np.random.set_state(state)
+            self._store(key, dataset)
+        else:
+            self.hits += 1
+
+        D, D_tilde = dataset
+        D.flags.writeable = False
+        D_tilde.flags.writeable = False
+        self._insert(key, (D, D_tilde))
+        return D, D_tilde
+
+    def clear(self):
+        '''
+        Empties the in-memory LRU; the on-disk store is left untouched.
+        '''
+        self._entries.clear()
+        self._nbytes = 0
+
+    def _insert(self, key, dataset):
+        nbytes = _dataset_nbytes(dataset)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = dataset
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= _dataset_nbytes(evicted)
+
+    def _paths(self, key):
+        return (os.path.join(self.directory, f"{key}_D.npy"),
+                os.path.join(self.directory, f"{key}_D_tilde.npy"))
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path_D, path_D_tilde = self._paths(key)
+        if not (os.path.exists(path_D) and os.path.exists(path_D_tilde)):
+            return None
+        return np.load(path_D), np.load(path_D_tilde)
+
+    def _store(self, key, dataset):
+        if self.directory is None:
+            return
+        # Write to a private temporary file and rename, so concurrent workers never
+        # read a partially written array.
+        for path, array in zip(self._paths(key), dataset):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+    def __getstate__(self):
+        # Only the configuration travels to worker processes, not the cached arrays.
+        state = self.__dict__.copy()
+        state['_entries'] = OrderedDict()
+        state['_nbytes'] = 0
+        return state
+
+
+def dataset_key(data_gen_func, data_params, seed):
+    '''
+    Hex digest identifying the dataset produced by data_gen_func(**data_params) under seed.
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        seed = (seed.entropy, tuple(seed.spawn_key))
+    description = repr((data_gen_func.__module__, data_gen_func.__qualname__,
+                        sorted(data_params.items()), seed))
+    return hashlib.sha256(description.encode()).hexdigest()[:32]
+
+
+def _legacy_seed(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed.generate_state(4)
+    return seed
+
+
+def _dataset_nbytes(dataset):
+    D, D_tilde = dataset
+    return D.nbytes if D is D_tilde else D.nbytes + D_tilde.nbytes
@@ -1,7 +1,13 @@
+import os
+from time import perf_counter
 import numpy as np
 
+from .common import limit_threads, restore_environment
+
+
 def run_experiments(num_runs, num_iterations, experiment, data_gen_func, base_seed=42, output="Error Plot",
-                    y_lab=r"\text{Relative Error} $\displaystyle\frac{\lVert \tilde{D} - WH \rVert}{\lVert \tilde{D} \rVert}$"):
+                    y_lab=r"\text{Relative Error} $\displaystyle\frac{\lVert \tilde{D} - WH \rVert}{\lVert \tilde{D} \rVert}$",
+                    n_jobs=None, blas_threads=None, cache=None, store=None):
     """
     Runs multiple experiments and collects error values.
 
@@ -20,47 +26,183 @@ def run_experiments(num_runs, num_iterations, experiment, data_gen_func, base_se
                                   and return a tuple (X, X_corrupted).
         base_seed (int): Base random seed for reproducibility.
         output string: Strings indicating what output to generate. Can be "Error Plot" or "Swimmer Image" (coming soon).
+        n_jobs (int): If None, runs everything in this process with one global seed per run, as in
+                      the original experiments. Otherwise every (run, label) job seeds its own
+                      random stream from np.random.SeedSequence(base_seed, spawn_key=(run, label_index)),
+                      so results do not depend on the number of workers, and n_jobs > 1 runs
+                      the jobs in that many worker processes. alg_func and data_gen_func must then
+                      be importable module-level functions.
+        blas_threads (int): BLAS threads per worker process when n_jobs > 1. Defaults to
+                            os.cpu_count() // n_jobs (at least 1) to avoid oversubscription.
+        cache (DatasetCache): Optional dataset_cache.DatasetCache. Each distinct (data_gen_func,
+                              data_params, run) dataset is then generated once under a per-run
+                              seed and shared read-only by all labels of that run, so every method
+                              sees identical corruption. Worker processes share the cache only
+                              through its on-disk store.
+        store (ResultsStore or str): Optional results_store.ResultsStore (or its directory).
+                                     Every finished run's error curve, runtime, seed and
+                                     parameters are appended to it as the run finishes, and
+                                     (label, seed) cells it already holds under the same
+                                     parameters are loaded instead of rerun, so an
+                                     interrupted sweep resumes where it stopped.
 
     Returns:
         results (dict): Dictionary mapping experiment labels to numpy arrays of error values with shape
                         (num_runs, T), where T is the length of the error vector returned by the algorithm.
     """
-    results = {label: [] for label in experiment}
-    runtimes = {label: [] for label in experiment}
-    seed = base_seed
-
-    for run in range(num_runs):
-        np.random.seed(seed)
-        for label, exp in experiment.items():
-            # Get data generation parameters (if any) and generate data.
-            data_params = exp.get('data_params', {})
-            D, D_tilde = data_gen_func(**data_params)
-
-            # Determine which data to use as reference and for training.
-            # data_input should be a tuple: (ref_choice, train_choice), each either "X" or "X_corrupted".
-            data_input = exp.get('data_input', ("X", "X_corrupted"))
-            D_ref = D_tilde if data_input[0] == "D_tilde" else D
-            D_train = D_tilde if data_input[1] == "D_tilde" else D
-
-            # Retrieve the algorithm function and any extra parameters.
-            alg_func = exp['alg_func']
-            alg_params = exp.get('alg_params', {})
-            model_rank = exp.get('model_rank', None)
-
-            # Run the algorithm. If model_rank is specified, pass it as the fourth argument.
-            outputs = alg_func(D_ref, D_train, num_iterations, model_rank, **alg_params)
-            # Assume that the error vector is the last output.
-            errors = outputs[-2]
-            results[label].append(errors)
-            runtime = outputs[-1]
-            runtimes[label].append(runtime)
-        seed += 1
+    if isinstance(store, str):
+        from .results_store import ResultsStore
+        store = ResultsStore(store)
+
+    results = {label: [None] * num_runs for label in experiment}
+    runtimes = {label: [None] * num_runs for label in experiment}
+
+    # Seed and parameter description of every (run, label) cell, and the stored results
+    # of the cells a previous, interrupted sweep already finished.
+    cells, done = {}, {}
+    if store is not None:
+        for run in range(num_runs):
+            for label_index, (label, exp) in enumerate(experiment.items()):
+                cell_seed = (str(base_seed + run) if n_jobs is None else
+                             f"SeedSequence({base_seed}, spawn_key=({run}, {label_index}))")
+                cells[run, label] = (cell_seed, _describe_cell(exp, num_iterations, data_gen_func, cache))
+                entry = store.find(label, *cells[run, label])
+                if entry is not None:
+                    done[run, label] = entry
+
+    def record(run, label, errors, runtime, wall):
+        results[label][run] = errors
+        runtimes[label][run] = runtime
+        if store is not None:
+            cell_seed, params = cells[run, label]
+            store.append(label, run, cell_seed, params, errors, runtime, wall)
+
+    if n_jobs is None:
+        seed = base_seed
+        for run in range(num_runs):
+            # All labels of a run draw from one global stream, so a run is replayed up to
+            # its last unfinished label; finished labels before it are rerun only to
+            # reproduce the stream.
+            missing = [label for label in experiment if (run, label) not in done]
+            if missing:
+                np.random.seed(seed)
+                # Cached data gets a stream of its own, as in the parallel branch: under
+                # the run's seed the initialization would replay the corruption draws.
+                data_seed = np.random.SeedSequence(base_seed, spawn_key=(run,))
+                for label, exp in experiment.items():
+                    start_time = perf_counter()
+                    errors, runtime = _run_single(exp, num_iterations, data_gen_func, cache, data_seed)
+                    if (run, label) not in done:
+                        record(run, label, errors, runtime, perf_counter() - start_time)
+                    if label == missing[-1]:
+                        break
+            seed += 1
+    else:
+        jobs = [(run, label, exp, num_iterations, data_gen_func,
+                 np.random.SeedSequence(base_seed, spawn_key=(run, label_index)),
+                 cache, np.random.SeedSequence(base_seed, spawn_key=(run,)))
+                for run in range(num_runs)
+                for label_index, (label, exp) in enumerate(experiment.items())
+                if (run, label) not in done]
+
+        if n_jobs == 1:
+            outputs = map(_run_job, jobs)
+        else:
+            outputs = _run_parallel(jobs, n_jobs, blas_threads)
+
+        for run, label, errors, runtime, wall in outputs:
+            record(run, label, errors, runtime, wall)
+
+    for (run, label), entry in done.items():
+        results[label][run] = store.load(entry)
+        runtimes[label][run] = entry['runtime']
 
     # Convert list of error vectors to numpy arrays.
     for label in results:
         results[label] = np.array(results[label])
 
     if output == "Error Plot":
-          plot_experiment(results, log_y_axis=True, y_lab=y_lab, runtimes=runtimes)
+        from .convergence_plot import plot_experiment
+        plot_experiment(results, log_y_axis=True, y_lab=y_lab, runtimes=runtimes)
     
-    return results
\ No newline at end of file
+    return results
+
+
+def _run_single(exp, num_iterations, data_gen_func, cache=None, data_seed=None):
+    """
+    Generates the data for one experiment specification and runs its algorithm once,
+    drawing from the current global NumPy random state. With a cache, the data is
+    looked up (or generated) under data_seed instead and the global state is only
+    used by the algorithm.
+
+    Returns:
+        errors (list): Error vector returned by the algorithm.
+        runtime (float): Runtime returned by the algorithm.
+    """
+    # Get data generation parameters (if any) and generate data.
+    data_params = exp.get('data_params', {})
+    if cache is not None:
+        D, D_tilde = cache.get(data_gen_func, data_params, data_seed)
+    else:
+        D, D_tilde = data_gen_func(**data_params)
+
+    # Determine which data to use as reference and for training.
+    # data_input should be a tuple: (ref_choice, train_choice), each either "X" or "X_corrupted".
+    data_input = exp.get('data_input', ("X", "X_corrupted"))
+    D_ref = D_tilde if data_input[0] == "D_tilde" else D
+    D_train = D_tilde if data_input[1] == "D_tilde" else D
+
+    # Retrieve the algorithm function and any extra parameters.
+    alg_func = exp['alg_func']
+    alg_params = exp.get('alg_params', {})
+    model_rank = exp.get('model_rank', None)
+
+    # Run the algorithm. If model_rank is specified, pass it as the fourth argument.
+    outputs = alg_func(D_ref, D_train, num_iterations, model_rank, **alg_params)
+    # Outputs are ordered (W, H, M, errors, runtime[, reconstructions]).
+    return outputs[3], outputs[4]
+
+
+def _run_job(job):
+    """
+    Runs one (run, label) job with the global random state seeded from its own SeedSequence.
+    """
+    run, label, exp, num_iterations, data_gen_func, seed_seq, cache, data_seed = job
+    start_time = perf_counter()
+    np.random.seed(seed_seq.generate_state(4))
+    errors, runtime = _run_single(exp, num_iterations, data_gen_func, cache, data_seed)
+    return run, label, errors, runtime, perf_counter() - start_time
+
+
+def _run_parallel(jobs, n_jobs, blas_threads):
+    """
+    Runs the jobs in a pool of freshly spawned worker processes with capped BLAS threads,
+    yielding their outputs as the jobs finish.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if blas_threads is None:
+        blas_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+
+    # Spawned workers import NumPy from scratch and read the thread limits from the
+    # environment they inherit, so set it only while the pool is alive.
+    saved = limit_threads(blas_threads)
+    try:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=context) as pool:
+            futures = [pool.submit(_run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        restore_environment(saved)
+
+
+def _describe_cell(exp, num_iterations, data_gen_func, cache):
+    """
+    Description of everything besides the seed that determines the result of one
+    experiment specification, used to match runs held by a ResultsStore.
+    """
+    from .results_store import describe
+    return describe({'experiment': exp, 'num_iterations': num_iterations,
+                     'data_gen_func': data_gen_func, 'cached': cache is not None})
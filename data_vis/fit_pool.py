@@ -0,0 +1,182 @@
+"""
+Process pool for many nmf/qmu fits on the same data without a copy of the data per worker.
+
+The data matrices are written once into shared memory (multiprocessing.shared_memory) or
+into a memory-mapped temporary file. Workers receive only the segment names, attach
+read-only NumPy views when they start and pass those views to every fit. Memory for the
+data is paid once regardless of the number of workers, and no matrix is pickled.
+
+Example:
+    with FitPool(D_tilde, D, n_jobs=8) as pool:
+        outputs = pool.map(qmu, [dict(max_iter=200, r=10, q=0.95, seed=k, history="none") for k in range(32)])
+"""
+import os
+import weakref
+
+import numpy as np
+
+from .common import limit_threads, restore_environment
+
+
+class SharedArray:
+    '''
+    A copy of an array in shared memory or in a memory-mapped file, described by a small
+    picklable handle that other processes use to attach a read-only view.
+
+    The creating process owns the segment; close() (also run when the object is garbage
+    collected or the interpreter exits) releases and removes it.
+
+    Parameters:
+        array (np.ndarray): Array to copy into the segment.
+        backing (str): "shm" for multiprocessing.shared_memory, "memmap" for a file.
+        directory (str): Directory of the file for backing="memmap" (default: tempdir).
+    '''
+
+    def __init__(self, array, backing="shm", directory=None):
+        array = np.asarray(array)
+        self.handle = {'backing': backing, 'shape': array.shape, 'dtype': array.dtype.str}
+        if backing == "shm":
+            from multiprocessing import shared_memory
+
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[...] = array
+            self.handle['name'] = segment.name
+            self._finalizer = weakref.finalize(self, _release_segment, segment)
+        elif backing == "memmap":
+            import tempfile
+
+            fd, path = tempfile.mkstemp(suffix=".dat", dir=directory)
+            os.close(fd)
+            target = np.memmap(path, dtype=array.dtype, mode='w+', shape=array.shape)
+            target[...] = array
+            target.flush()
+            del target
+            self.handle['name'] = path
+            self._finalizer = weakref.finalize(self, _remove_file, path)
+        else:
+            raise ValueError(f"Unknown shared array backing: {backing!r}")
+
+    def close(self):
+        '''
+        Releases and removes the segment. Views attached in other processes must not be
+        used afterwards.
+        '''
+        self._finalizer()
+
+
+def attach(handle):
+    '''
+    Returns a read-only np.ndarray view of the SharedArray described by handle, together
+    with the object that keeps the mapping alive.
+    '''
+    if handle['backing'] == "shm":
+        from multiprocessing import shared_memory
+
+        # Spawned workers share the parent's resource tracker, so attaching registers
+        # nothing new and the segment is unlinked only by its owner.
+        segment = shared_memory.SharedMemory(name=handle['name'])
+        view = np.ndarray(handle['shape'], dtype=handle['dtype'], buffer=segment.buf)
+        keep_alive = segment
+    else:
+        keep_alive = np.memmap(handle['name'], dtype=handle['dtype'], mode='r', shape=handle['shape'])
+        # A plain ndarray view of the mapping, so qmu treats it as in-memory data.
+        view = np.asarray(keep_alive)
+    view.flags.writeable = False
+    return view, keep_alive
+
+
+class FitPool:
+    '''
+    Pool of worker processes that share one copy of D_tilde and D.
+
+    Parameters:
+        D_tilde (np.ndarray): Reference data passed as the first argument of each fit.
+        D (np.ndarray): Training data passed as the second argument. If it is D_tilde (or
+                        None), a single segment serves both.
+        n_jobs (int): Number of worker processes (default: number of CPUs).
+        blas_threads (int): BLAS threads per worker (default: CPUs divided by n_jobs).
+        backing (str): "shm" (shared memory) or "memmap" (temporary file, e.g. on a disk
+                       with more room than /dev/shm).
+        directory (str): Directory of the temporary files for backing="memmap".
+    '''
+
+    def __init__(self, D_tilde, D=None, n_jobs=None, blas_threads=None, backing="shm", directory=None):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        if blas_threads is None:
+            blas_threads = max(1, (os.cpu_count() or 1) // self.n_jobs)
+
+        self._arrays = [SharedArray(D_tilde, backing, directory)]
+        if D is not None and D is not D_tilde:
+            self._arrays.append(SharedArray(D, backing, directory))
+        handles = [array.handle for array in self._arrays]
+
+        # Spawned workers read the BLAS thread limits from the environment when they
+        # import NumPy; workers start lazily, so the limits stay set while the pool lives.
+        self._saved_env = limit_threads(blas_threads)
+        context = multiprocessing.get_context("spawn")
+        self._pool = ProcessPoolExecutor(max_workers=self.n_jobs, mp_context=context,
+                                         initializer=_init_worker, initargs=(handles,))
+
+    def submit(self, func, **params):
+        '''
+        Schedules func(D_tilde, D, **params) in a worker and returns a Future. func must be
+        importable by the workers and take a history argument, e.g. qmu.qmu or nmf.nmf.
+        history defaults to "none", since every recorded reconstruction would otherwise be
+        pickled back to this process.
+        '''
+        params.setdefault("history", "none")
+        return self._pool.submit(_call, func, params)
+
+    def map(self, func, params_list):
+        '''
+        Runs func(D_tilde, D, **params) for every dict in params_list and returns the
+        outputs in order.
+        '''
+        futures = [self.submit(func, **params) for params in params_list]
+        return [future.result() for future in futures]
+
+    def close(self):
+        '''
+        Shuts down the workers and removes the shared segments.
+        '''
+        self._pool.shutdown()
+        restore_environment(self._saved_env)
+        for array in self._arrays:
+            array.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Views attached by this worker process, set by _init_worker.
+_worker_data = None
+
+
+def _init_worker(handles):
+    global _worker_data
+    attached = [attach(handle) for handle in handles]
+    views = [view for view, _ in attached]
+    _worker_data = (views[0], views[-1], [keep_alive for _, keep_alive in attached])
+
+
+def _call(func, params):
+    D_tilde, D, _ = _worker_data
+    return func(D_tilde, D, **params)
+
+
+def _release_segment(segment):
+    segment.close()
+    segment.unlink()
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
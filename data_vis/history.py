@@ -0,0 +1,147 @@
+from collections import deque
+import numpy as np
+
+
+class ReconstructionHistory:
+    '''
+    Records the reconstructions W @ H produced by nmf/qmu under a bounded-memory policy.
+
+    The history behaves like a read-only list of reconstructions (len, indexing and
+    iteration), ordered by iteration. The iteration number of each record is stored
+    in `iterations`.
+
+    Parameters:
+        every (int): Record iteration i only if i % every == 0. every=0 records nothing.
+        last (int): If given, keep only the most recent `last` records (ring buffer).
+        columns (list): If given, record only these columns of W @ H, i.e. W @ H[:, columns].
+                        This avoids forming the full product.
+        factors (bool): If True, store copies of the factors (W, H) instead of the product
+                        and rebuild the reconstruction when a record is read.
+        spill (str): Path of a file backing the records with np.memmap instead of RAM.
+                     Not supported together with factors=True.
+    '''
+
+    def __init__(self, every=1, last=None, columns=None, factors=False, spill=None):
+        if every < 0:
+            raise ValueError("every must be nonnegative")
+        if last is not None and last < 1:
+            raise ValueError("last must be a positive integer")
+        if factors and spill is not None:
+            raise ValueError("factor snapshots cannot be spilled to disk")
+
+        self.every = every
+        self.last = last
+        self.columns = None if columns is None else np.asarray(columns)
+        self.factors = factors
+        self.spill = spill
+        self.reset(0)
+
+    def reset(self, max_iter):
+        '''
+        Clears the history before a run of max_iter iterations (plus the initial iterate).
+        '''
+        self.iterations = deque(maxlen=self.last)
+        self._records = deque(maxlen=self.last)
+        self._memmap = None
+        self._count = 0
+        if self.every > 0:
+            self._capacity = self.last or (max_iter // self.every + 1)
+        else:
+            self._capacity = 0
+
+    def wants(self, i):
+        '''
+        Returns True if iteration i is recorded under this policy.
+        '''
+        return self.every > 0 and i % self.every == 0
+
+    def __call__(self, iteration, W, H, M, timings):
+        '''
+        Records the iterate as an nmf/qmu callback (see observers.py), so a history can
+        also be attached with callbacks=[...] next to or instead of history=. Call
+        reset(max_iter) first when the records are spilled to disk.
+        '''
+        self.record(iteration, W, H)
+
+    def record(self, i, W, H, WH=None):
+        '''
+        Records iteration i if the policy asks for it.
+
+        Parameters:
+            i (int): Iteration number (0 for the initialization).
+            W (np.ndarray): Current dictionary matrix.
+            H (np.ndarray): Current representation matrix.
+            WH (np.ndarray): Optional already computed product W @ H. It is copied,
+                             never kept by reference.
+        '''
+        if not self.wants(i):
+            return
+
+        self.iterations.append(i)
+        if self.factors:
+            self._records.append((W.copy(), H.copy()))
+            return
+
+        if WH is not None:
+            rec = WH if self.columns is None else WH[:, self.columns]
+        else:
+            rec = W @ H if self.columns is None else W @ H[:, self.columns]
+
+        if self.spill is None:
+            self._records.append(rec.copy() if rec is WH else rec)
+        else:
+            if self._memmap is None:
+                self._memmap = np.memmap(self.spill, dtype=rec.dtype, mode='w+',
+                                         shape=(self._capacity,) + rec.shape)
+            self._memmap[self._count % self._capacity] = rec
+        self._count += 1
+
+    def __len__(self):
+        return len(self.iterations)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [self[j] for j in range(len(self))[k]]
+        n = len(self)
+        if k < 0:
+            k += n
+        if not 0 <= k < n:
+            raise IndexError("history index out of range")
+
+        if self.factors:
+            W, H = self._records[k]
+            return W @ H if self.columns is None else W @ H[:, self.columns]
+        if self.spill is None:
+            return self._records[k]
+        # Oldest surviving record sits right after the newest one in the ring.
+        start = self._count - n
+        return self._memmap[(start + k) % self._capacity]
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+
+def make_history(history, max_iter):
+    '''
+    Resolves the history argument of nmf/qmu to a ReconstructionHistory reset for max_iter iterations.
+
+    Parameters:
+        history (str or ReconstructionHistory): "full" records every reconstruction,
+                                                "none" records nothing, or a configured
+                                                ReconstructionHistory.
+        max_iter (int): Number of iterations of the upcoming run.
+
+    Returns:
+        ReconstructionHistory: The history to record into.
+    '''
+    if isinstance(history, ReconstructionHistory):
+        pass
+    elif history == "full":
+        history = ReconstructionHistory()
+    elif history == "none":
+        history = ReconstructionHistory(every=0)
+    else:
+        raise ValueError(f"Unknown history policy: {history!r}")
+    history.reset(max_iter)
+    return history
@@ -0,0 +1,76 @@
+"""
+Cold-start import time of the solver modules, checked against a budget.
+
+Each module is imported in a fresh interpreter, after NumPy, so the measured time is what
+the module itself adds to the start of a worker process. The check also fails if importing
+a core module loads one of the optional heavy dependencies (plotting, .mat loading, GIF
+rendering, JIT compilers), which must only be imported on first use.
+
+Example:
+    python -m data_vis.import_time --budget 0.05
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CORE_MODULES = ("common", "quantile", "history", "stopping", "backend", "observers", "solvers", "nmf", "qmu",
+                "restarts", "model", "online_qmu", "data_gen", "dataset_cache", "results_store", "experiment",
+                "fit_pool", "tuner")
+HEAVY_MODULES = ("matplotlib", "scipy", "PIL", "numba", "numexpr", "h5py")
+
+_PROBE = """
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import data_vis.{module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def import_time(module, repeat=5):
+    """
+    Measures the import of module in fresh interpreters.
+
+    Parameters:
+        module (str): Name of a module of the data_vis package.
+        repeat (int): Number of fresh interpreters; the fastest import is reported.
+
+    Returns:
+        seconds (float): Fastest import time, excluding NumPy.
+        loaded (list): Modules of HEAVY_MODULES that the import loaded.
+    """
+    # Run from the directory holding data_vis, so that the package is importable from a
+    # source checkout as well as when installed.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times, loaded = [], []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, check=True, cwd=root).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result['time'])
+        loaded = result['loaded']
+    return min(times), loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start import time of the solver modules.")
+    parser.add_argument("--modules", nargs="+", default=list(CORE_MODULES))
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds per module on top of NumPy")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules:
+        seconds, loaded = import_time(module, args.repeat)
+        over = seconds > args.budget
+        failed = failed or over or bool(loaded)
+        note = (" over budget" if over else "") + (f" loads {', '.join(loaded)}" if loaded else "")
+        print(f"{module:>14}: {1000 * seconds:7.1f} ms{note}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
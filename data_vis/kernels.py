@@ -0,0 +1,136 @@
+"""
+Optional accelerated backends for the fused QMU engine.
+
+Importing this module registers a "numba" backend if Numba is installed and a "numexpr"
+backend if numexpr is installed. qmu(..., backend="auto") imports it and picks the first
+available of numba, numexpr and plain NumPy.
+"""
+import numpy as np
+
+from .backend import NumpyBackend, register_backend
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _residual(D, WH, out):
+        m, n = D.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                out[i, j] = abs(D[i, j] - WH[i, j])
+
+    @numba.njit(parallel=True, cache=True)
+    def _apply_mask(E, threshold, D, WH, M, MD):
+        m, n = D.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                keep = E[i, j] <= threshold
+                M[i, j] = keep
+                if keep:
+                    MD[i, j] = D[i, j]
+                else:
+                    MD[i, j] = 0
+                    WH[i, j] = 0
+
+    @numba.njit(parallel=True, cache=True)
+    def _mask_product(D, WH, threshold, M, MD):
+        m, n = D.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                keep = abs(D[i, j] - WH[i, j]) <= threshold
+                M[i, j] = keep
+                if keep:
+                    MD[i, j] = D[i, j]
+                else:
+                    MD[i, j] = 0
+                    WH[i, j] = 0
+
+    @numba.njit(parallel=True, cache=True)
+    def _remask(WH, M):
+        m, n = WH.shape
+        for i in numba.prange(m):
+            for j in range(n):
+                if not M[i, j]:
+                    WH[i, j] = 0
+
+    @numba.njit(parallel=True, cache=True)
+    def _squared_error(X, WH):
+        m, n = X.shape
+        total = 0.0
+        for i in numba.prange(m):
+            row = 0.0
+            for j in range(n):
+                d = X[i, j] - WH[i, j]
+                row += d * d
+            total += row
+        return total
+
+    class NumbaBackend(NumpyBackend):
+        '''
+        Multithreaded Numba kernels that make each elementwise stage a single pass over memory.
+        '''
+
+        name = "numba"
+
+        def residual(self, D, WH, out):
+            _residual(D, WH, out)
+            return out
+
+        def apply_mask(self, E, threshold, D, WH, M, MD):
+            _apply_mask(E, E.dtype.type(threshold), D, WH, M, MD)
+
+        def mask_product(self, D, WH, threshold, M, MD):
+            _mask_product(D, WH, D.dtype.type(threshold), M, MD)
+
+        def remask(self, WH, M):
+            _remask(WH, M)
+
+        def squared_error(self, X, WH, out):
+            return _squared_error(X, WH)
+
+    register_backend("numba", NumbaBackend)
+
+
+if numexpr is not None:
+
+    class NumexprBackend(NumpyBackend):
+        '''
+        Multithreaded numexpr evaluation of the elementwise stages.
+        '''
+
+        name = "numexpr"
+
+        def residual(self, D, WH, out):
+            numexpr.evaluate("abs(D - WH)", out=out)
+            return out
+
+        def apply_mask(self, E, threshold, D, WH, M, MD):
+            t = E.dtype.type(threshold)
+            numexpr.evaluate("E <= t", out=M)
+            numexpr.evaluate("where(M, D, 0)", out=MD)
+            numexpr.evaluate("where(M, WH, 0)", out=WH)
+
+        def mask_product(self, D, WH, threshold, M, MD):
+            t = D.dtype.type(threshold)
+            numexpr.evaluate("abs(D - WH) <= t", out=M)
+            numexpr.evaluate("where(M, D, 0)", out=MD)
+            numexpr.evaluate("where(M, WH, 0)", out=WH)
+
+        def remask(self, WH, M):
+            numexpr.evaluate("where(M, WH, 0)", out=WH)
+
+        def squared_error(self, X, WH, out):
+            numexpr.evaluate("(X - WH) ** 2", out=out)
+            return np.sum(out, dtype=np.float64)
+
+    register_backend("numexpr", NumexprBackend)
@@ -0,0 +1,149 @@
+import numpy as np
+
+from .qmu import qmu, quantile_mask, fit_H
+
+
+class QMUModel:
+    '''
+    Stateful QMU model that can be refit incrementally as new data columns arrive.
+
+    fit learns the dictionary W and representation H of an initial data matrix with qmu.
+    partial_fit then appends new columns: it keeps W, solves only for the new columns of H
+    under a quantile mask of the new batch, and can refine W from running statistics of
+    everything seen so far. Its cost scales with the size of the new batch.
+
+    The W update of QMU is
+        W <- W * ((M * D) @ H.T) / ((M * (W @ H)) @ H.T).
+    For columns that are already fit, H and the mask are frozen, so the numerator is the
+    running sum A = sum (M * D) @ H.T and the denominator row i is W[i] @ (G - C[i]), with
+    G = sum H @ H.T and C[i] the sum of h_j h_j^T over the excluded entries (i, j). These
+    take O(m r^2) memory and are updated with each batch.
+
+    Parameters:
+        r (int): Target rank for the factorization.
+        q (float): Quantile threshold for masking (typically set to 1 - corruption_rate).
+        max_iter (int): Number of qmu iterations in fit.
+        transform_iter (int): Number of H updates used to fit the columns of a new batch.
+        seed (int): Random number generator seed.
+        **qmu_params: Additional keyword arguments for qmu in fit (e.g. engine).
+    '''
+
+    def __init__(self, r, q, max_iter=400, transform_iter=100, seed=None, **qmu_params):
+        self.r = r
+        self.q = q
+        self.max_iter = max_iter
+        self.transform_iter = transform_iter
+        self.seed = seed
+        self.qmu_params = qmu_params
+        self.W = None
+        self.H = None
+
+    def fit(self, D):
+        '''
+        Fits W and H to the data matrix D (m x n) from a fresh random initialization.
+
+        Returns:
+            self (QMUModel): The fitted model.
+        '''
+        W, H, _, errors, _, _ = qmu(D, D, self.max_iter, self.r, self.q, seed=self.seed,
+                                    history="none", **self.qmu_params)
+        self.W, self.H = W, H
+        self.errors = errors
+        self._rng = np.random.default_rng(self.seed)
+
+        M = quantile_mask(D, W, H, self.q)
+        m = D.shape[0]
+        self._A = np.zeros((m, self.r))
+        self._G = np.zeros((self.r, self.r))
+        self._C = np.zeros((m, self.r, self.r))
+        self._add_statistics(D, H, M, sign=1)
+        return self
+
+    def transform(self, D_new, H_init=None, max_iter=None):
+        '''
+        Fits representation columns for D_new (m x n_new) with the dictionary W held fixed.
+
+        Parameters:
+            D_new (np.ndarray): New data columns.
+            H_init (np.ndarray): Optional initial representation (r x n_new); random by default.
+            max_iter (int): Number of H updates; defaults to transform_iter.
+
+        Returns:
+            H_new (np.ndarray): Representation of the new columns (r x n_new).
+        '''
+        return self._solve_H(D_new, H_init, max_iter)[0]
+
+    def partial_fit(self, D_new, refine_iter=0):
+        '''
+        Appends the columns D_new (m x n_new) to the model.
+
+        Parameters:
+            D_new (np.ndarray): New data columns.
+            refine_iter (int): Number of passes that refine W from the running statistics,
+                               each followed by a refit of the new columns of H.
+
+        Returns:
+            self (QMUModel): The updated model.
+        '''
+        if self.W is None:
+            return self.fit(D_new)
+
+        H_new, M_new = self._solve_H(D_new)
+        self._add_statistics(D_new, H_new, M_new, sign=1)
+
+        for _ in range(refine_iter):
+            self.W = statistics_w_update(self.W, self._A, self._G, self._C)
+
+            # Refit this batch's columns with the refined W, swapping its statistics.
+            self._add_statistics(D_new, H_new, M_new, sign=-1)
+            H_new, M_new = self._solve_H(D_new, H_new)
+            self._add_statistics(D_new, H_new, M_new, sign=1)
+
+        self.H = np.hstack([self.H, H_new])
+        return self
+
+    def _solve_H(self, D_new, H_init=None, max_iter=None):
+        '''
+        Multiplicative H updates for D_new under the quantile mask of the batch, with W fixed.
+        '''
+        H = np.abs(self._rng.standard_normal((self.r, D_new.shape[1]))) if H_init is None else H_init
+        H = fit_H(D_new, self.W, H, self.q, self.transform_iter if max_iter is None else max_iter)
+        return H, quantile_mask(D_new, self.W, H, self.q)
+
+    def _add_statistics(self, D, H, M, sign):
+        '''
+        Adds (sign=1) or removes (sign=-1) the W-update statistics of the columns (D, H, M).
+        '''
+        A, G, C = w_update_statistics(D, H, M)
+        self._A += sign * A
+        self._G += sign * G
+        self._C += sign * C
+
+
+def w_update_statistics(D, H, M, chunk_size=1 << 14):
+    '''
+    Sufficient statistics of the masked QMU W update for the columns (D, H) under mask M.
+
+    Returns:
+        A (np.ndarray): Masked numerator (M * D) @ H.T, shape (m, r).
+        G (np.ndarray): Gram matrix H @ H.T, shape (r, r).
+        C (np.ndarray): Per-row Gram corrections, C[i] = sum of h_j h_j^T over the entries
+                        (i, j) excluded by M, shape (m, r, r).
+    '''
+    r = H.shape[0]
+    C = np.zeros((D.shape[0], r, r))
+    rows, cols = np.nonzero(M == 0)
+    for start in range(0, len(rows), chunk_size):
+        h = H[:, cols[start:start + chunk_size]].T
+        np.add.at(C, rows[start:start + chunk_size], np.einsum('jr,js->jrs', h, h))
+    return (M * D) @ H.T, H @ H.T, C
+
+
+def statistics_w_update(W, A, G, C):
+    '''
+    One multiplicative W update from the statistics of w_update_statistics, i.e.
+    W * A / (W @ G - W @ C) with the row-wise corrections applied.
+    '''
+    epsilon = 1e-10
+    den = W @ G - np.einsum('ir,irs->is', W, C)
+    return W * (A / (np.maximum(den, 0) + epsilon))
@@ -1,18 +1,39 @@
 import numpy as np
-from common import relative_error
+from .common import RelativeErrorTracker
+from .history import make_history
+from .stopping import make_stopping
+from .observers import make_observers, notify
+from .solvers import run_solver
 from time import time
 
-def nmf(X_ref, X_train, max_iter, r, seed=None):
+def nmf(X_ref, X_train, max_iter, r, seed=None, history="full", stopping=None, dtype=np.float64, callbacks=None,
+        profiler=None, solver="mu", inner=None):
     """
     Runs the standard multiplicative updates NMF algorithm.
 
     Parameters:
         X_ref (np.ndarray): Data used for error measurement.
                             (This can be either the uncorrupted data or X_train itself.)
-        X_train (np.ndarray): Data used for training the model.
+        X_train (np.ndarray): Data used for training the model. X_ref and X_train may also be
+                              scipy.sparse matrices; the products with X_train stay sparse.
         max_iter (int): Number of iterations.
         r (int): Target rank for the factorization.
         seed (int): Random number generator seed
+        history (str or ReconstructionHistory): Which reconstructions to keep: "full",
+                                                "none", or a configured ReconstructionHistory.
+        stopping (StoppingCriteria): Optional early stopping criteria; after the run its
+                                     reason and iteration attributes say why and when the
+                                     run stopped.
+        dtype (np.dtype): Floating point type of the iteration, np.float64 or np.float32.
+                          X_train and the factors are cast to it.
+        callbacks (callable or list): Called as callback(iteration, W, H, None, timings) after
+                                      every iteration; a callback returning True stops the
+                                      run (see observers.py).
+        profiler (PhaseTimer): Optional observers.PhaseTimer that accumulates the time spent
+                               in the W update, H update and error phases.
+        solver (str): "mu" for the multiplicative updates, or one of the faster-converging
+                      solvers of solvers.py: "amu", "hals", "amu_nesterov", "hals_nesterov".
+        inner (int): Inner updates per factor and iteration for the solvers of solvers.py.
 
     Returns:
         W (np.ndarray): Learned dictionary matrix.
@@ -20,6 +41,7 @@ def nmf(X_ref, X_train, max_iter, r, seed=None):
         (None): For consistency of return orderings. QMU returns the mask matrix here.
         errors (list): List of relative error values computed against X_ref.
         runtime (float): Runtime of algorithm, not including relative error measurements
+        reconstructions (ReconstructionHistory): Recorded reconstructions W @ H.
     """
     m, n = X_train.shape
 
@@ -28,24 +50,52 @@ def nmf(X_ref, X_train, max_iter, r, seed=None):
         np.random.seed(seed)
 
     # Initialize factor matrices with nonnegative entries.
-    W = np.abs(np.random.randn(m, r))
-    H = np.abs(np.random.randn(r, n))
+    dtype = np.dtype(dtype)
+    W = np.abs(np.random.randn(m, r)).astype(dtype, copy=False)
+    H = np.abs(np.random.randn(r, n)).astype(dtype, copy=False)
+    X_is_ref = X_ref is X_train
+    X_train = X_train.astype(dtype, copy=False)
 
-    errors = [relative_error(X_ref, W, H)]
-    reconstructions = [W @ H]
+    reconstructions = make_history(history, max_iter)
+    stopping = make_stopping(stopping, max_iter)
+    callbacks, profiler = make_observers(callbacks, profiler)
+    if solver != "mu":
+        return run_solver(X_ref, X_train, W, H, max_iter, solver, inner=inner, reconstructions=reconstructions,
+                          stopping=stopping, callbacks=callbacks, profiler=profiler)
+
+    relative_error = RelativeErrorTracker(X_ref)
+    errors = [relative_error(W, H)]
+    reconstructions.record(0, W, H)
     runtime = 0
 
     for i in range(max_iter):
         start_time = time()
+        if profiler is not None:
+            profiler.start()
         epsilon = 1e-10
 
-        # Multiplicative update rules for standard NMF.
-        W = W * ((X_train @ H.T) / (((W @ H) @ H.T) + epsilon))
-        H = H * ((W.T @ X_train) / ((W.T @ (W @ H)) + epsilon))
+        # Multiplicative update rules for standard NMF. The denominators are grouped
+        # through the r x r Gram matrices so no dense m x n product is formed.
+        W = W * ((X_train @ H.T) / ((W @ (H @ H.T)) + epsilon))
+        if profiler is not None:
+            profiler.lap("W")
+        WtX = (X_train.T @ W).T
+        H = H * (WtX / (((W.T @ W) @ H) + epsilon))
+        if profiler is not None:
+            profiler.lap("H")
 
         # Increment the runtime and calculate the relative error.
         runtime += time() - start_time
-        errors.append(relative_error(X_ref, W, H))
-        reconstructions.append(W @ H)
+        # W.T @ X_train is reused for the error when the reference is the training data.
+        errors.append(relative_error(W, H, WtX if X_is_ref else None))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H)
+        if callbacks and notify(callbacks, i + 1, W, H, None, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors):
+            break
 
+    if profiler is not None:
+        profiler.stop()
     return W, H, None, errors, runtime, reconstructions
@@ -0,0 +1,138 @@
+"""
+Iteration callbacks and per-phase profiling for nmf and qmu.
+
+A callback is any callable
+    callback(iteration, W, H, M, timings)
+that nmf and qmu call after every iteration (M is None for nmf and for the "masked" and
+"blocked" qmu engines, which never store a dense mask). timings maps the phases of that iteration
+("quantile", "mask", "W", "H", "error") to seconds. If a callback returns True the run
+stops after that iteration. With no callbacks and no profiler the solvers skip all of
+this bookkeeping.
+"""
+import tracemalloc
+from time import perf_counter
+
+from .common import RelativeErrorTracker
+
+
+class PhaseTimer:
+    '''
+    Times the phases of each iteration of a fit and accumulates the totals.
+
+    Pass an instance as nmf(..., profiler=...) or qmu(..., profiler=...) and read totals
+    (and allocated) after the run. Phases an engine does not separate are absent or
+    merged: the "blocked" qmu engine masks inside its single pass over the blocks, which
+    also accumulates the H update's products and is timed as "W"; nmf has no mask.
+
+    Parameters:
+        track_memory (bool): Also record, per phase, the peak number of bytes allocated
+                             through Python and NumPy above the phase's starting point.
+                             This uses tracemalloc and slows the fit down noticeably.
+
+    Attributes:
+        timings (dict): Seconds per phase of the current iteration.
+        totals (dict): Seconds per phase summed over all iterations.
+        allocated (dict): Peak bytes allocated per phase, summed over all iterations
+                          (only with track_memory).
+        iterations (int): Number of iterations timed.
+    '''
+
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.totals = {}
+        self.allocated = {}
+        self.iterations = 0
+        self.timings = {}
+        self._started_tracing = False
+
+    def start(self):
+        '''
+        Marks the beginning of an iteration.
+        '''
+        self.timings = {}
+        self.iterations += 1
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._last = perf_counter()
+
+    def lap(self, phase):
+        '''
+        Attributes the time since the previous lap (or start) to phase.
+        '''
+        elapsed = perf_counter() - self._last
+        self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+        self.totals[phase] = self.totals.get(phase, 0.0) + elapsed
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.allocated[phase] = self.allocated.get(phase, 0) + max(peak - self._base, 0)
+            tracemalloc.reset_peak()
+            self._base = current
+        self._last = perf_counter()
+
+    def stop(self):
+        '''
+        Stops tracemalloc if this timer started it.
+        '''
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def make_observers(callbacks, profiler):
+    '''
+    Normalizes the callbacks and profiler arguments of nmf and qmu.
+
+    Parameters:
+        callbacks (callable or list): None, a single callback, or a list of callbacks.
+        profiler (PhaseTimer): Optional timer.
+
+    Returns:
+        callbacks (tuple): The callbacks to notify each iteration.
+        profiler (PhaseTimer): The timer, created when callbacks need timings, or None
+                               if neither was given.
+    '''
+    if callbacks is None:
+        callbacks = ()
+    elif callable(callbacks):
+        callbacks = (callbacks,)
+    else:
+        callbacks = tuple(callbacks)
+    if profiler is None and callbacks:
+        profiler = PhaseTimer()
+    return callbacks, profiler
+
+
+def notify(callbacks, iteration, W, H, M, timings):
+    '''
+    Calls every callback and returns True if any of them asks to stop.
+    '''
+    stop = False
+    for callback in callbacks:
+        stop = bool(callback(iteration, W, H, M, timings)) or stop
+    return stop
+
+
+class ErrorObserver:
+    '''
+    Callback that records the relative error against a reference matrix, for runs that
+    only need errors at some iterations.
+
+    Parameters:
+        X_ref (np.ndarray): Reference data.
+        every (int): Record the error every this many iterations.
+    '''
+
+    def __init__(self, X_ref, every=1):
+        self.relative_error = RelativeErrorTracker(X_ref)
+        self.every = every
+        self.iterations = []
+        self.errors = []
+
+    def __call__(self, iteration, W, H, M, timings):
+        if iteration % self.every == 0:
+            self.iterations.append(iteration)
+            self.errors.append(self.relative_error(W, H))
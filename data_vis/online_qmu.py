@@ -0,0 +1,99 @@
+import numpy as np
+from time import time
+
+from .model import w_update_statistics, statistics_w_update
+from .qmu import fit_H
+from .quantile import QuantileSketch
+
+
+class OnlineQMU:
+    '''
+    Online (mini-batch) QMU over a stream of column batches of a data matrix with m rows.
+
+    Each batch is fit in three steps:
+    1. Its representation columns are solved with the dictionary W fixed, under the
+       quantile mask of the batch itself.
+    2. The batch's residual magnitudes update a running QuantileSketch. The mask for
+       learning W uses the sketch's global q-quantile.
+    3. The batch's sufficient statistics (see model.w_update_statistics) are added to
+       exponentially forgotten running sums, and W takes a few multiplicative steps
+       from them.
+    Memory is O(m r^2) for the statistics plus the current batch, independent of the
+    number of columns streamed so far.
+
+    Parameters:
+        r (int): Target rank for the factorization.
+        q (float): Quantile threshold for masking (typically set to 1 - corruption_rate).
+        forgetting (float): Factor in (0, 1] applied to the running statistics and the
+                            sketch before each batch; 1 weights the whole stream equally.
+        h_iter (int): Number of H updates per batch.
+        w_iter (int): Number of W updates per batch.
+        sketch_size (int): Number of samples kept by the residual quantile sketch.
+        seed (int): Random number generator seed.
+    '''
+
+    def __init__(self, r, q, forgetting=0.95, h_iter=50, w_iter=5, sketch_size=1 << 16, seed=None):
+        self.r = r
+        self.q = q
+        self.forgetting = forgetting
+        self.h_iter = h_iter
+        self.w_iter = w_iter
+        self.rng = np.random.default_rng(seed)
+        self.sketch = QuantileSketch(sketch_size, forgetting, rng=self.rng)
+        self.W = None
+        self.n_seen = 0
+
+    def partial_fit(self, D_b):
+        '''
+        Fits a batch of columns D_b (m x n_b) and updates W.
+
+        Returns:
+            H_b (np.ndarray): Representation of the batch (r x n_b), computed with W before
+                              this batch's update.
+        '''
+        m, n_b = D_b.shape
+        if self.W is None:
+            self.W = np.abs(self.rng.standard_normal((m, self.r)))
+            self._A = np.zeros((m, self.r))
+            self._G = np.zeros((self.r, self.r))
+            self._C = np.zeros((m, self.r, self.r))
+
+        H_b = fit_H(D_b, self.W, np.abs(self.rng.standard_normal((self.r, n_b))), self.q, self.h_iter)
+
+        E = np.abs(D_b - self.W @ H_b)
+        self.sketch.update(E)
+        M = (E <= self.sketch.quantile(self.q)).astype(np.float64)
+
+        A, G, C = w_update_statistics(D_b, H_b, M)
+        self._A = self.forgetting * self._A + A
+        self._G = self.forgetting * self._G + G
+        self._C = self.forgetting * self._C + C
+        for _ in range(self.w_iter):
+            self.W = statistics_w_update(self.W, self._A, self._G, self._C)
+
+        self.n_seen += n_b
+        return H_b
+
+
+def online_qmu(batches, r, q, seed=None, **params):
+    '''
+    Runs online QMU over an iterable of column batches and yields one result per batch.
+
+    Parameters:
+        batches (iterable): Column blocks D_b (m x n_b) of the data, e.g. from a generator or
+                            a file reader. It may be unbounded.
+        r (int): Target rank for the factorization.
+        q (float): Quantile threshold for masking (typically set to 1 - corruption_rate).
+        seed (int): Random number generator seed
+        **params: Further OnlineQMU parameters (forgetting, h_iter, w_iter, sketch_size).
+
+    Yields:
+        W (np.ndarray): Dictionary after the batch (the model's array, not a copy).
+        H_b (np.ndarray): Representation of the batch.
+        runtime (float): Time spent on the batch.
+    '''
+    model = OnlineQMU(r, q, seed=seed, **params)
+    for D_b in batches:
+        start_time = time()
+        H_b = model.partial_fit(D_b)
+        yield model.W, H_b, time() - start_time
@@ -1,8 +1,23 @@
-from common import relative_error
+from .common import RelativeErrorTracker, issparse, dense_rows
+from .quantile import quantile_threshold, blocked_quantile_threshold, sample_size, local_thresholds, local_mask
+from .history import make_history
+from .stopping import make_stopping
+from .backend import get_backend, NumpyBackend
+from .observers import make_observers, notify
 import numpy as np
 from time import time
 
-def qmu(D_tilde, D, max_iter, r, q, seed=None):
+# Ulps of an unmasked sum below which the "masked" engine recomputes a masked sum exactly.
+CANCELLATION = 1024
+# Entries of D from which engine="auto" picks the compiled kernels. Below it, loading (and
+# possibly compiling) them costs more than the fused engine saves.
+AUTO_FUSED_SIZE = 1 << 20
+
+
+def qmu(D_tilde, D, max_iter, r, q, seed=None, engine="auto", quantile_method="exact", quantile_tol=0.01,
+        history="full", block_rows=None, stopping=None, dtype=np.float64, backend="auto", callbacks=None,
+        profiler=None, solver="mu", inner=None, mask_mode="global", tile_shape=(256, 256), mask_every=1,
+        quantile_workers=None):
     '''
     Runs the Quantile Multiplicative Updates (QMU) algorithm.
 
@@ -10,52 +25,565 @@ def qmu(D_tilde, D, max_iter, r, q, seed=None):
         D_tilde (np.ndarray): Reference (uncorrupted) data used for error measurement.
                               If testing on uncorrupted data, set D_tilde = D.
         D (np.ndarray): Input data (possibly corrupted) used for training the model.
+                        D_tilde and D may also be scipy.sparse matrices (CSR preferred);
+                        sparse D always runs with the "blocked" engine, as does out-of-core D
+                        (an np.memmap, e.g. from data_gen.open_matrix, or an HDF5 dataset)
+                        unless another engine is requested explicitly.
         max_iter (int): Number of iterations to run.
         r (int): Target rank for the factorization.
         q (float): Quantile threshold for masking (typically set to 1 - corruption_rate).
         seed (int):  Random number generator seed
+        engine (str): "auto" (default) for "fused" when D is an in-memory array of at least
+                      AUTO_FUSED_SIZE entries and backend resolves to accelerated Numba
+                      or numexpr kernels, and "numpy" otherwise. "numpy" for the reference
+                      implementation, or "fused" to compute W @ H once per half-step into
+                      preallocated buffers (same iterates up to floating-point rounding,
+                      no m x n allocations per iteration), or "masked" to keep the
+                      excluded entries as a sparse index set and apply the mask as a
+                      sparse correction to the unmasked products, or "blocked" to process
+                      D in row blocks so that no m x n array is ever formed. Its passes
+                      stream D block by block.
+        quantile_method (str): How the mask threshold is computed: "exact" (selection, same
+                               value as np.quantile) or "sample" (estimate from a random
+                               sample of residual entries, see quantile.quantile_threshold).
+        quantile_tol (float): Rank error bound for quantile_method="sample".
+        history (str or ReconstructionHistory): Which reconstructions to keep: "full",
+                                                "none", or a configured ReconstructionHistory.
+        block_rows (int): Rows of D per block for the "blocked" engine. Defaults to about
+                          2^20 entries per block.
+        stopping (StoppingCriteria): Optional early stopping criteria; after the run its
+                                     reason and iteration attributes say why and when the
+                                     run stopped. The "blocked" engine rejects mask_tol.
+        dtype (np.dtype): Floating point type of the iteration, np.float64 or np.float32. The
+                          data and factors are cast to it; float32 halves memory traffic.
+                          Errors are still accumulated in float64. The "masked" engine
+                          recomputes exactly the masked sums that lose float32 precision
+                          to cancellation, so with large corruptions most of its rows
+                          may take the exact path.
+        backend (str or NumpyBackend): Array backend for the elementwise passes of the "fused"
+                                       engine (see backend.register_backend). "auto" uses the
+                                       Numba or numexpr kernels of kernels.py when installed
+                                       and plain NumPy otherwise; with engine="auto" the
+                                       kernels are then used for large D.
+        callbacks (callable or list): Called as callback(iteration, W, H, M, timings) after
+                                      every iteration; a callback returning True stops the
+                                      run (see observers.py). M is None for "masked"
+                                      and "blocked".
+        profiler (PhaseTimer): Optional observers.PhaseTimer that accumulates the time spent
+                               in the quantile, mask, W update, H update and error phases.
+        solver (str): "mu" for the multiplicative updates, or one of the faster-converging
+                      solvers of solvers.py: "amu", "hals", "amu_nesterov", "hals_nesterov".
+                      They minimize a majorizer of the masked objective in which the
+                      excluded entries are imputed, and need the "numpy" engine.
+        inner (int): Inner updates per factor and iteration for the solvers of solvers.py.
+        mask_mode (str): "global" for one q-quantile over all residual entries, or "row",
+                         "column" or "tile" for an exact q-quantile of each row, column or
+                         tile of the residual (see quantile.local_thresholds). The local
+                         modes ignore quantile_method. The "blocked" engine computes "row"
+                         and "tile" thresholds inside its single pass and has no "column" mode.
+        tile_shape (tuple): (rows, columns) of a tile for mask_mode="tile".
+        mask_every (int): Recompute the mask only every mask_every iterations and reuse the
+                          previous one in between. The "blocked" engine, which never stores
+                          the mask, recomputes it every iteration and raises ValueError
+                          for mask_every > 1.
+        quantile_workers (int): Threads for the local thresholds.
 
     Returns:
         W (np.ndarray): Learned dictionary matrix.
         H (np.ndarray): Learned representation matrix.
-        M (np.ndarray): Final masking matrix.
+        M (np.ndarray): Final masking matrix. The "blocked" engine never stores the mask and
+                        returns the final residual threshold (float) instead, or the
+                        array of local thresholds (see quantile.local_thresholds).
         errors (list): List of relative error values computed with respect to D_tilde.
         runtime (float): Runtime of algorithm, not including relative error measurements
+        reconstructions (ReconstructionHistory): Recorded reconstructions W @ H.
     '''
+    if engine not in ("auto", "numpy", "fused", "masked", "blocked"):
+        raise ValueError(f"Unknown QMU engine: {engine!r}")
+    if engine == "auto":
+        # The fused engine runs its elementwise passes through the array backend, so it
+        # is the one that benefits from compiled kernels.
+        engine = "numpy"
+        if (solver == "mu" and isinstance(D, np.ndarray) and not isinstance(D, np.memmap)
+                and D.size >= AUTO_FUSED_SIZE):
+            backend = get_backend(backend)
+            if type(backend) is not NumpyBackend:
+                engine = "fused"
+    if issparse(D):
+        if engine not in ("numpy", "blocked"):
+            raise ValueError(f"QMU engine {engine!r} does not support sparse D")
+        engine = "blocked"
+    elif isinstance(D, np.memmap) or not isinstance(D, np.ndarray):
+        if engine == "numpy":
+            engine = "blocked"
+    if solver != "mu" and engine != "numpy":
+        raise ValueError(f"Solver {solver!r} requires the 'numpy' engine and in-memory D")
+    if mask_mode not in ("global", "row", "column", "tile"):
+        raise ValueError(f"Unknown mask mode: {mask_mode!r}")
+    if mask_mode == "column" and engine == "blocked":
+        raise ValueError("The 'blocked' engine does not support mask_mode='column'")
+    if engine == "blocked" and stopping is not None and stopping.mask_tol is not None:
+        raise ValueError("The 'blocked' engine never stores the mask and does not support mask_tol")
+    if engine == "blocked" and mask_every != 1:
+        raise ValueError("The 'blocked' engine never stores the mask and does not support mask_every > 1")
+
     m, n = D.shape
 
     if seed is not None:
         np.random.seed(seed)
 
     # Initialize factor matrices with nonnegative entries.
-    W = np.abs(np.random.randn(m, r))
-    H = np.abs(np.random.randn(r, n))
+    dtype = np.dtype(dtype)
+    W = np.abs(np.random.randn(m, r)).astype(dtype, copy=False)
+    H = np.abs(np.random.randn(r, n)).astype(dtype, copy=False)
+
+    # Separate stream for sampled thresholds so the initialization is unaffected. Without
+    # a seed it is drawn from the global state (after the initialization, and only when
+    # it is used), so np.random.seed(...) also makes sampled thresholds reproducible.
+    if seed is None and quantile_method == "sample":
+        rng = np.random.default_rng(np.random.randint(0, 2**63, dtype=np.uint64))
+    else:
+        rng = np.random.default_rng(seed)
+    if isinstance(D, np.ndarray) and not isinstance(D, np.memmap):
+        D = D.astype(dtype, copy=False)
+    elif issparse(D):
+        D = D.astype(dtype, copy=False)
+    reconstructions = make_history(history, max_iter)
+    stopping = make_stopping(stopping, max_iter)
 
+    callbacks, profiler = make_observers(callbacks, profiler)
+
+    options = dict(quantile_method=quantile_method, quantile_tol=quantile_tol, rng=rng,
+                   reconstructions=reconstructions, stopping=stopping, callbacks=callbacks, profiler=profiler,
+                   mask_mode=mask_mode, tile_shape=tile_shape, mask_every=mask_every,
+                   quantile_workers=quantile_workers)
+    if solver != "mu":
+        from .solvers import run_solver
+        return run_solver(D_tilde, D, W, H, max_iter, solver, q, inner, **options)
+    if engine == "fused":
+        return _qmu_fused(D_tilde, D, W, H, max_iter, q, backend=get_backend(backend), **options)
+    if engine == "masked":
+        return _qmu_masked(D_tilde, D, W, H, max_iter, q, **options)
+    if engine == "blocked":
+        return _qmu_blocked(D_tilde, D, W, H, max_iter, q, block_rows=block_rows, **options)
+
+    relative_error = RelativeErrorTracker(D_tilde)
     errors = []
-    errors.append(relative_error(D_tilde, W, H))
-    reconstructions = [W @ H]
+    errors.append(relative_error(W, H))
+    reconstructions.record(0, W, H)
     runtime = 0
 
     for i in range(max_iter):
         start_time = time()
+        if profiler is not None:
+            profiler.start()
         epsilon = 1e-10
 
-        # Construct the quantile mask
-        M = quantile_mask(D, W, H, q)
+        # Construct the quantile mask (the steps of quantile_mask, timed separately),
+        # or keep the previous one.
+        if i % mask_every == 0:
+            M = residual_mask(np.abs(D - np.dot(W, H)), q, mask_mode, quantile_method, quantile_tol, rng,
+                              tile_shape, quantile_workers, profiler=profiler)
+            if profiler is not None:
+                profiler.lap("mask")
 
         # Update rules for W and H
-        W = W * (( (M * D) @ H.T ) / ( ((M * (W @ H)) @ H.T) + epsilon ))
-        H = H * (( W.T @ (M * D) ) / ( (W.T @ (M * (W @ H))) + epsilon ))
+        MD = M * D
+        W = masked_update_W(W, H, M, MD)
+        if profiler is not None:
+            profiler.lap("W")
+        H = masked_update_H(W, H, M, MD)
+        if profiler is not None:
+            profiler.lap("H")
 
         # Increment the runtime and calculate the relative error.
         runtime += time() - start_time
-        errors.append(relative_error(D_tilde, W, H))
-        reconstructions.append(W @ H)
+        errors.append(relative_error(W, H))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H)
+        if callbacks and notify(callbacks, i + 1, W, H, M, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors, mask=M if i % mask_every == 0 else None):
+            break
 
+    if profiler is not None:
+        profiler.stop()
     return W, H, M, errors, runtime, reconstructions
 
 
-def quantile_mask(X, W, H, q):
+def _qmu_fused(D_tilde, D, W, H, max_iter, q, quantile_method, quantile_tol, rng, reconstructions, stopping=None,
+               backend=None, callbacks=(), profiler=None, mask_mode="global", tile_shape=None, mask_every=1,
+               quantile_workers=None):
+    '''
+    QMU iterations that form W @ H exactly once per half-step.
+
+    The product WH, the residual E and the masked data M * D live in buffers
+    allocated once up front; every elementwise step writes into them with out=,
+    through the array backend. The product left in WH at the end of an iteration
+    is reused for the error measurement and for the next iteration's mask and
+    W update. All buffers share the dtype of W.
+    '''
+    epsilon = 1e-10
+    backend = get_backend("numpy") if backend is None else backend
+    D = np.ascontiguousarray(D, dtype=W.dtype)
+    D_tilde = np.ascontiguousarray(D_tilde, dtype=W.dtype)
+    W = np.ascontiguousarray(W)
+    H = np.ascontiguousarray(H)
+
+    WH = W @ H
+    E = np.empty_like(WH)
+    MD = np.empty_like(WH)
+    M = np.empty(WH.shape, dtype=bool)
+
+    # Small r x r and factor-sized work arrays, also reused every iteration.
+    num_W = np.empty_like(W)
+    den_W = np.empty_like(W)
+    num_H = np.empty_like(H)
+    den_H = np.empty_like(H)
+
+    ref_norm = RelativeErrorTracker(D_tilde).ref_norm
+    errors = [backend.squared_error(D_tilde, WH, E) / (ref_norm + epsilon)]
+    reconstructions.record(0, W, H, WH)
+    runtime = 0
+
+    for i in range(max_iter):
+        start_time = time()
+        if profiler is not None:
+            profiler.start()
+
+        # Quantile mask from the residual of the current product. A sampled threshold
+        # only needs the residual at the sampled entries, so the residual, comparison
+        # and masking are then a single pass. Otherwise MD doubles as the scratch
+        # buffer for the selection, which reorders its input.
+        if i % mask_every != 0:
+            # Reuse the mask; M * D is still in MD.
+            backend.remask(WH, M)
+        elif mask_mode != "global":
+            backend.residual(D, WH, E)
+            thresholds = local_thresholds(E, q, mask_mode, tile_shape, quantile_workers)
+            if profiler is not None:
+                profiler.lap("quantile")
+            local_mask(E, thresholds, mask_mode, tile_shape, out=M)
+            np.multiply(D, M, out=MD)
+            backend.remask(WH, M)
+        elif quantile_method == "sample" and sample_size(quantile_tol) < D.size:
+            positions = rng.integers(0, D.size, size=sample_size(quantile_tol))
+            sample = np.abs(np.take(D, positions) - np.take(WH, positions))
+            threshold = quantile_threshold(sample, q, overwrite=True)
+            if profiler is not None:
+                profiler.lap("quantile")
+            backend.mask_product(D, WH, threshold, M, MD)
+        else:
+            backend.residual(D, WH, E)
+            threshold = quantile_threshold(E, q, quantile_method, buffer=MD, tol=quantile_tol, rng=rng)
+            if profiler is not None:
+                profiler.lap("quantile")
+            backend.apply_mask(E, threshold, D, WH, M, MD)
+        if profiler is not None:
+            profiler.lap("mask")
+
+        # W half-step: (M * D) @ H.T / ((M * WH) @ H.T).
+        np.matmul(MD, H.T, out=num_W)
+        np.matmul(WH, H.T, out=den_W)
+        den_W += epsilon
+        np.divide(num_W, den_W, out=num_W)
+        W *= num_W
+        if profiler is not None:
+            profiler.lap("W")
+
+        # H half-step with the updated W; M * D is unchanged.
+        np.matmul(W, H, out=WH)
+        backend.remask(WH, M)
+        np.matmul(W.T, MD, out=num_H)
+        np.matmul(W.T, WH, out=den_H)
+        den_H += epsilon
+        np.divide(num_H, den_H, out=num_H)
+        H *= num_H
+
+        # Product for the next iteration, shared with the error measurement.
+        np.matmul(W, H, out=WH)
+        if profiler is not None:
+            profiler.lap("H")
+
+        runtime += time() - start_time
+        errors.append(backend.squared_error(D_tilde, WH, E) / (ref_norm + epsilon))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H, WH)
+        if callbacks and notify(callbacks, i + 1, W, H, M, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors, mask=M if i % mask_every == 0 else None):
+            break
+
+    if profiler is not None:
+        profiler.stop()
+
+    return W, H, M.astype(W.dtype), errors, runtime, reconstructions
+
+
+def _qmu_masked(D_tilde, D, W, H, max_iter, q, quantile_method, quantile_tol, rng, reconstructions, stopping=None,
+                callbacks=(), profiler=None, mask_mode="global", tile_shape=None, mask_every=1, quantile_workers=None):
+    '''
+    QMU iterations with the mask stored as the sparse set of excluded entries.
+
+    Only a (1 - q) fraction of entries are masked out, so with C_X the matrix holding
+    X on the excluded entries and zero elsewhere,
+        (M * D) @ H.T = D @ H.T - C_D @ H.T,
+        (M * WH) @ H.T = W @ (H @ H.T) - C_WH @ H.T,
+    and likewise for the H update, so the masked denominators never touch an m x n array.
+
+    The excluded set is kept in row-major order, i.e. as a CSR pattern, by its int32 row
+    and column indices and the excluded values of D: 16 bytes per excluded entry in
+    float64 (12 in float32), plus 8 while a half-step holds the excluded entries of W @ H
+    and 8 for the flat indices kept for stopping.mask_tol. At q = 0.95 that is about
+    1.2 bytes per matrix entry instead of 8 for a dense float mask. Recomputing the mask
+    still needs the residual, which is formed in two m x n buffers (W @ H and |D - WH|)
+    allocated once, so these buffers dominate the memory of a run.
+
+    The subtraction cancels when the excluded entries carry most of a row's (or column's)
+    sum, e.g. large corruptions, local mask modes or float32. Rows of the W update and
+    columns of the H update where more than half the entries are excluded, or where a
+    masked sum is below CANCELLATION ulps of its unmasked sum, are recomputed exactly from
+    dense slices of D and W @ H.
+    '''
+    from scipy import sparse
+
+    epsilon = 1e-10
+    m, n = D.shape
+    D = np.ascontiguousarray(D, dtype=W.dtype)
+    index_dtype = np.int32 if max(m, n) < np.iinfo(np.int32).max else np.int64
+
+    # Product and residual buffers, allocated once.
+    WH = np.empty((m, n), dtype=W.dtype)
+    E = np.empty((m, n), dtype=W.dtype)
+
+    relative_error = RelativeErrorTracker(D_tilde)
+    errors = [relative_error(W, H)]
+    reconstructions.record(0, W, H)
+    runtime = 0
+
+    for i in range(max_iter):
+        start_time = time()
+        if profiler is not None:
+            profiler.start()
+
+        if i % mask_every == 0:
+            # Residual and threshold. WH is free once E is formed and serves as scratch.
+            np.matmul(W, H, out=WH)
+            np.subtract(D, WH, out=E)
+            np.abs(E, out=E)
+            if mask_mode == "global":
+                threshold = quantile_threshold(E, q, quantile_method, buffer=WH, tol=quantile_tol, rng=rng)
+                if profiler is not None:
+                    profiler.lap("quantile")
+                excluded = np.flatnonzero(E > threshold)
+            else:
+                thresholds = local_thresholds(E, q, mask_mode, tile_shape, quantile_workers)
+                if profiler is not None:
+                    profiler.lap("quantile")
+                excluded = np.flatnonzero(~local_mask(E, thresholds, mask_mode, tile_shape))
+
+            # Excluded entries in row-major order, i.e. already a CSR pattern.
+            rows = (excluded // n).astype(index_dtype)
+            cols = (excluded % n).astype(index_dtype)
+            indptr = np.zeros(m + 1, dtype=index_dtype)
+            np.cumsum(np.bincount(rows, minlength=m), out=indptr[1:])
+            D_excluded = D.reshape(-1)[excluded]
+            crowded_rows = np.diff(indptr) > n // 2
+            crowded_cols = np.bincount(cols, minlength=n) > m // 2
+            if stopping is None or stopping.mask_tol is None:
+                excluded = None
+            if profiler is not None:
+                profiler.lap("mask")
+        C = sparse.csr_matrix((D_excluded, cols, indptr), shape=(m, n))
+
+        # W half-step.
+        full_W = D @ H.T
+        num_W = np.maximum(full_W - C @ H.T, 0)
+        C.data = product_entries(W, H, rows, cols)
+        gram_W = W @ (H @ H.T)
+        den_W = np.maximum(gram_W - C @ H.T, 0)
+        exact = np.flatnonzero(crowded_rows | _cancelled(num_W, full_W) | _cancelled(den_W, gram_W))
+        if len(exact):
+            M_R = _dense_mask(exact, rows, cols, n, W.dtype)
+            num_W[exact] = (M_R * D[exact]) @ H.T
+            den_W[exact] = (M_R * (W[exact] @ H)) @ H.T
+        W = W * (num_W / (den_W + epsilon))
+        if profiler is not None:
+            profiler.lap("W")
+
+        # H half-step with the updated W on the same excluded set.
+        C.data = D_excluded
+        full_H = W.T @ D
+        num_H = np.maximum(full_H - (C.T @ W).T, 0)
+        C.data = product_entries(W, H, rows, cols)
+        gram_H = (W.T @ W) @ H
+        den_H = np.maximum(gram_H - (C.T @ W).T, 0)
+        exact = np.flatnonzero(crowded_cols | _cancelled(num_H.T, full_H.T) | _cancelled(den_H.T, gram_H.T))
+        if len(exact):
+            M_C = _dense_mask(exact, cols, rows, m, W.dtype).T
+            num_H[:, exact] = W.T @ (M_C * D[:, exact])
+            den_H[:, exact] = W.T @ (M_C * (W @ H[:, exact]))
+        H = H * (num_H / (den_H + epsilon))
+        if profiler is not None:
+            profiler.lap("H")
+
+        runtime += time() - start_time
+        errors.append(relative_error(W, H))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H)
+        if callbacks and notify(callbacks, i + 1, W, H, None, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors, excluded=excluded if i % mask_every == 0 else None,
+                                                      size=m * n):
+            break
+
+    if profiler is not None:
+        profiler.stop()
+
+    # Expand the final excluded set to the dense mask returned by the other engines, in
+    # place of the residual buffers.
+    del WH, E
+    M = np.ones((m, n), dtype=W.dtype)
+    M[rows, cols] = 0
+    return W, H, M, errors, runtime, reconstructions
+
+
+def _qmu_blocked(D_tilde, D, W, H, max_iter, q, quantile_method, quantile_tol, rng, reconstructions,
+                 stopping=None, block_rows=None, callbacks=(), profiler=None, mask_mode="global", tile_shape=None,
+                 mask_every=1, quantile_workers=None):
+    '''
+    QMU iterations over row blocks of D, so that at most one dense block of block_rows
+    rows is formed at a time. D can be any row-sliceable matrix: an in-memory array,
+    an np.memmap or HDF5 dataset streamed from disk, or a scipy.sparse matrix.
+
+    The threshold is a global quantile over all residual entries, computed blockwise
+    (two passes for the exact quantile, one for the sampled estimate). The W update is
+    row-local, so a last pass updates each block of W and accumulates the masked
+    products W^T (M * D) and W^T (M * WH) needed by the H update.
+
+    With mask_mode "row" or "tile" the thresholds only depend on the block itself, so they
+    are computed inside that last pass and no separate quantile pass is needed; blocks
+    are then whole bands of tiles.
+    '''
+    epsilon = 1e-10
+    m, n = D.shape
+    if issparse(D):
+        D = D.tocsr()
+    if block_rows is None:
+        block_rows = max(1, (1 << 20) // n)
+    if mask_mode == "tile":
+        block_rows = -(-block_rows // tile_shape[0]) * tile_shape[0]
+    starts = range(0, m, block_rows)
+    block_thresholds = {}
+
+    def residual_blocks():
+        for start in starts:
+            stop = start + block_rows
+            yield np.abs(dense_rows(D, start, stop, W.dtype) - W[start:stop] @ H)
+
+    relative_error = RelativeErrorTracker(D_tilde)
+    errors = [relative_error(W, H)]
+    reconstructions.record(0, W, H)
+    runtime = 0
+
+    for i in range(max_iter):
+        start_time = time()
+        if profiler is not None:
+            profiler.start()
+
+        if mask_mode == "global":
+            threshold = blocked_quantile_threshold(residual_blocks, m * n, q, quantile_method,
+                                                   tol=quantile_tol, rng=rng)
+            if profiler is not None:
+                profiler.lap("quantile")
+
+        W_new = np.empty_like(W)
+        num_H = np.zeros_like(H)
+        den_H = np.zeros_like(H)
+        for start in starts:
+            stop = start + block_rows
+            D_b = dense_rows(D, start, stop, W.dtype)
+            WH_b = W[start:stop] @ H
+            if mask_mode == "global":
+                M_b = np.abs(D_b - WH_b) <= threshold
+            else:
+                E_b = np.abs(D_b - WH_b)
+                block_thresholds[start] = local_thresholds(E_b, q, mask_mode, tile_shape, quantile_workers)
+                M_b = local_mask(E_b, block_thresholds[start], mask_mode, tile_shape)
+
+            # W half-step for the rows of this block. D_b may be a view of D.
+            MD_b = D_b * M_b
+            WH_b *= M_b
+            W_b = W[start:stop] * ((MD_b @ H.T) / ((WH_b @ H.T) + epsilon))
+            W_new[start:stop] = W_b
+
+            # This block's share of the H half-step with the updated rows of W.
+            WH_b = W_b @ H
+            WH_b *= M_b
+            num_H += W_b.T @ MD_b
+            den_H += W_b.T @ WH_b
+
+        W = W_new
+        if profiler is not None:
+            profiler.lap("W")
+        H = H * (num_H / (den_H + epsilon))
+        if profiler is not None:
+            profiler.lap("H")
+
+        runtime += time() - start_time
+        errors.append(relative_error(W, H))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H)
+        if callbacks and notify(callbacks, i + 1, W, H, None, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors):
+            break
+
+    if profiler is not None:
+        profiler.stop()
+
+    # The mask is never stored; return the final threshold(s) it was defined by instead.
+    if mask_mode != "global":
+        threshold = np.concatenate([block_thresholds[start] for start in starts])
+    return W, H, threshold, errors, runtime, reconstructions
+
+
+def _dense_mask(selected, major, minor, size, dtype):
+    '''
+    Dense mask of the lines `selected` (sorted) of the excluded set (major[k], minor[k]),
+    one line of `size` entries per selected index, 0 on the excluded entries.
+    '''
+    positions = np.flatnonzero(np.isin(major, selected))
+    M = np.ones((len(selected), size), dtype=dtype)
+    M[np.searchsorted(selected, major[positions]), minor[positions]] = 0
+    return M
+
+
+def _cancelled(masked, full):
+    '''
+    Rows of masked (a masked sum of nonnegative terms formed as full minus the excluded
+    part) that lost their accuracy to cancellation, i.e. have an entry below
+    CANCELLATION ulps of the corresponding entry of full.
+    '''
+    return np.any(masked < CANCELLATION * np.finfo(full.dtype).eps * full, axis=1)
+
+
+def product_entries(W, H, rows, cols, chunk_size=1 << 16):
+    '''
+    Entries (W @ H)[rows, cols] computed in chunks, without forming W @ H.
+    '''
+    out = np.empty(len(rows), dtype=np.result_type(W, H))
+    for start in range(0, len(rows), chunk_size):
+        stop = start + chunk_size
+        np.einsum('ij,ji->i', W[rows[start:stop]], H[:, cols[start:stop]], out=out[start:stop])
+    return out
+
+
+def quantile_mask(X, W, H, q, method="exact", tol=0.01, rng=None):
     '''
     Constructs a binary quantile mask M based on the error matrix.
 
@@ -64,17 +592,85 @@ def quantile_mask(X, W, H, q):
         W (np.ndarray): Current dictionary matrix.
         H (np.ndarray): Current representation matrix.
         q (float): Quantile threshold (a number between 0 and 1).
+        method (str): Threshold method, "exact" or "sample" (see quantile.quantile_threshold).
+        tol (float): Rank error bound for method="sample".
+        rng (np.random.Generator): Generator for method="sample".
 
     Returns:
         M (np.ndarray): Binary mask of the same shape as X.
     '''
-    # Compute the residual error matrix.
-    E = np.abs(X - np.dot(W, H))
+    # Mask of the residual error matrix: 1 for entries with error <= threshold, 0 otherwise.
+    return residual_mask(np.abs(X - np.dot(W, H)), q, quantile_method=method, quantile_tol=tol, rng=rng)
 
-    # Compute the q-quantile threshold.
-    threshold = np.quantile(E, q)
 
-    # Create mask: 1 for entries with error <= threshold, 0 otherwise.
-    M = (E <= threshold).astype(np.float64)
+def residual_mask(E, q, mask_mode="global", quantile_method="exact", quantile_tol=0.01, rng=None, tile_shape=None,
+                  quantile_workers=None, buffer=None, profiler=None):
+    '''
+    The QMU mask of the residual magnitudes E: 1 for the entries at most their q-quantile
+    threshold and 0 for the others, in the dtype of E. This is the mask step shared by the
+    "numpy" engine, the solvers of solvers.py and the tuner.
 
-    return M
+    Parameters:
+        E (np.ndarray): Residual magnitudes |D - W @ H|.
+        q (float): Quantile level.
+        mask_mode, quantile_method, quantile_tol, rng, tile_shape, quantile_workers: See qmu.
+        buffer (np.ndarray): Scratch array of E's size for the global threshold, see
+                             quantile.quantile_threshold.
+        profiler (PhaseTimer): Optional phase timer, lapped after the threshold(s).
+
+    Returns:
+        M (np.ndarray): Binary mask of the same shape as E.
+    '''
+    if mask_mode == "global":
+        threshold = quantile_threshold(E, q, quantile_method, buffer=buffer, tol=quantile_tol, rng=rng)
+        if profiler is not None:
+            profiler.lap("quantile")
+        return (E <= threshold).astype(E.dtype)
+    thresholds = local_thresholds(E, q, mask_mode, tile_shape, quantile_workers)
+    if profiler is not None:
+        profiler.lap("quantile")
+    return local_mask(E, thresholds, mask_mode, tile_shape).astype(E.dtype)
+
+
+def masked_update_W(W, H, M, MD, WH=None):
+    '''
+    One multiplicative QMU update of W under the mask M,
+        W * ((M * D) @ H.T) / ((M * (W @ H)) @ H.T).
+
+    Parameters:
+        W (np.ndarray): Current dictionary matrix.
+        H (np.ndarray): Current representation matrix.
+        M (np.ndarray): Mask (1 for included entries, 0 for excluded ones).
+        MD (np.ndarray): Masked data M * D.
+        WH (np.ndarray): Optional precomputed W @ H.
+
+    Returns:
+        W (np.ndarray): Updated dictionary matrix.
+    '''
+    epsilon = 1e-10
+    WH = W @ H if WH is None else WH
+    return W * ((MD @ H.T) / (((M * WH) @ H.T) + epsilon))
+
+
+def masked_update_H(W, H, M, MD):
+    '''
+    One multiplicative QMU update of H under the mask M,
+        H * (W.T @ (M * D)) / (W.T @ (M * (W @ H))),
+    with the arguments of masked_update_W.
+    '''
+    epsilon = 1e-10
+    return H * ((W.T @ MD) / ((W.T @ (M * (W @ H))) + epsilon))
+
+
+def fit_H(D, W, H, q, max_iter):
+    '''
+    Multiplicative H updates for D with W held fixed, recomputing the quantile mask of
+    the current fit before each update.
+
+    Returns:
+        H (np.ndarray): Fitted representation matrix.
+    '''
+    for _ in range(max_iter):
+        M = quantile_mask(D, W, H, q)
+        H = masked_update_H(W, H, M, M * D)
+    return H
@@ -0,0 +1,287 @@
+import numpy as np
+
+
+def quantile_threshold(E, q, method="exact", buffer=None, overwrite=False, tol=0.01, delta=1e-3, rng=None):
+    '''
+    Computes the q-quantile of the entries of E, as used for the QMU mask threshold.
+
+    Parameters:
+        E (np.ndarray): Residual magnitudes (any shape; all entries are pooled).
+        q (float): Quantile (a number between 0 and 1).
+        method (str): "exact" selects the order statistics with np.partition (introselect)
+                      and interpolates linearly, matching np.quantile(E, q).
+                      "sample" estimates the quantile from a uniform random sample of entries.
+        buffer (np.ndarray): Optional preallocated array of E's size. For method "exact" the
+                             entries are copied into it and partitioned there, so no new
+                             m x n array is allocated. Ignored if overwrite is True.
+        overwrite (bool): If True, partition E itself. E is reordered and must not be used
+                          afterwards.
+        tol (float): For method "sample", bound on the rank error of the estimate, i.e. the
+                     returned value is an exact quantile for some level in [q - tol, q + tol].
+        delta (float): For method "sample", probability that the rank error exceeds tol.
+        rng (np.random.Generator): Generator for method "sample". Defaults to a fresh
+                                   np.random.default_rng().
+
+    Returns:
+        threshold (float): The (estimated) q-quantile of E.
+    '''
+    if method == "exact":
+        if overwrite:
+            a = E.reshape(-1)
+        elif buffer is not None:
+            a = buffer.reshape(-1)
+            np.copyto(a, E.reshape(-1))
+        else:
+            a = np.array(E, dtype=E.dtype).reshape(-1)
+        return _select_quantile(a, q)
+
+    if method == "sample":
+        N = E.size
+        k = sample_size(tol, delta)
+        if k >= N:
+            return quantile_threshold(E, q, "exact", buffer=buffer, overwrite=overwrite)
+        rng = np.random.default_rng() if rng is None else rng
+        sample = np.take(E, rng.integers(0, N, size=k))
+        return _select_quantile(sample, q)
+
+    raise ValueError(f"Unknown quantile method: {method!r}")
+
+
+def blocked_quantile_threshold(blocks, N, q, method="exact", tol=0.01, bracket_tol=1e-3, delta=1e-3, rng=None):
+    '''
+    Computes the q-quantile of the entries of a matrix that is only available block by block,
+    e.g. residual row blocks that are computed on the fly.
+
+    Parameters:
+        blocks (callable): Returns a fresh iterable over the blocks (arrays of any shape),
+                           in the same order on every call. Each call is one pass.
+        N (int): Total number of entries over all blocks.
+        q (float): Quantile (a number between 0 and 1).
+        method (str): "sample" estimates the quantile from a uniform sample drawn in one pass.
+                      "exact" uses a second pass: a sample brackets the target order statistics,
+                      then only the entries inside the bracket are collected and selected.
+                      The result matches np.quantile over all entries.
+        tol (float): For method "sample", bound on the rank error of the estimate.
+        bracket_tol (float): For method "exact", rank half-width of the bracket. About
+                             4 * bracket_tol * N entries are collected in the second pass.
+        delta (float): Probability that the sampled rank error exceeds its bound. For method
+                       "exact" this only costs another pass with a wider bracket.
+        rng (np.random.Generator): Generator for the sample.
+
+    Returns:
+        threshold (float): The (estimated) q-quantile of all entries.
+    '''
+    if method not in ("exact", "sample"):
+        raise ValueError(f"Unknown quantile method: {method!r}")
+
+    k = sample_size(tol if method == "sample" else bracket_tol, delta)
+    if k >= N:
+        return _select_quantile(np.concatenate([b.reshape(-1) for b in blocks()]), q)
+
+    # One pass drawing a uniform sample at sorted global positions.
+    rng = np.random.default_rng() if rng is None else rng
+    positions = np.sort(rng.integers(0, N, size=k))
+    sample = np.empty(k)
+    offset = filled = 0
+    for block in blocks():
+        block = block.reshape(-1)
+        stop = np.searchsorted(positions, offset + block.size)
+        sample[filled:stop] = block[positions[filled:stop] - offset]
+        filled = stop
+        offset += block.size
+
+    if method == "sample":
+        return _select_quantile(sample, q)
+
+    virtual = q * (N - 1)
+    lo = int(np.floor(virtual))
+    hi = min(lo + 1, N - 1)
+    margin = 2 * bracket_tol
+    while True:
+        lower = _select_quantile(sample, q - margin) if q - margin > 0 else -np.inf
+        upper = _select_quantile(sample, q + margin) if q + margin < 1 else np.inf
+
+        # Second pass: count entries below the bracket and keep those inside it.
+        n_below = 0
+        candidates = []
+        for block in blocks():
+            n_below += np.count_nonzero(block < lower)
+            candidates.append(block[(block >= lower) & (block <= upper)])
+        candidates = np.concatenate(candidates)
+
+        if n_below <= lo and hi < n_below + candidates.size:
+            lo_c, hi_c = lo - n_below, hi - n_below
+            candidates.partition([lo_c, hi_c] if hi_c != lo_c else lo_c)
+            return _interpolate(candidates[lo_c], candidates[hi_c], virtual - lo)
+        margin *= 2
+
+
+def stacked_quantile_threshold(E, q):
+    '''
+    Exact q-quantile of each E[k] over all its entries, for a stack of K residual matrices.
+
+    Parameters:
+        E (np.ndarray): Residual magnitudes of shape (K, ...).
+        q (float): Quantile (a number between 0 and 1).
+
+    Returns:
+        thresholds (np.ndarray): Array of shape (K,), matching np.quantile on each E[k].
+    '''
+    # Partition each contiguous row of a copy in turn; np.quantile(..., axis=1) partitions
+    # strided columns, and a single 2-D partition call is slower than K 1-D calls.
+    rows = np.array(E, order='C').reshape(len(E), -1)
+    return np.array([_select_quantile(row, q) for row in rows])
+
+
+def local_thresholds(E, q, mode, tile_shape=(256, 256), workers=None):
+    '''
+    Exact q-quantiles of E over each row, each column or each tile, instead of one global
+    quantile. Each threshold is a selection over a small slice, and the slices are split into
+    chunks that are processed in a thread pool when workers > 1. E is not modified.
+
+    Parameters:
+        E (np.ndarray): Residual magnitudes of shape (m, n).
+        q (float): Quantile (a number between 0 and 1).
+        mode (str): "row", "column" or "tile".
+        tile_shape (tuple): (rows, columns) of a tile for mode="tile"; edge tiles are smaller.
+        workers (int): Number of threads. None or 1 computes the thresholds sequentially.
+
+    Returns:
+        thresholds (np.ndarray): Shape (m,) for "row", (n,) for "column", and
+                                 (ceil(m / rows), ceil(n / columns)) for "tile".
+    '''
+    m, n = E.shape
+    if mode == "row":
+        chunks = [slice(start, start + 256) for start in range(0, m, 256)]
+        work = lambda rows: stacked_quantile_threshold(E[rows], q)
+    elif mode == "column":
+        chunks = [slice(start, start + 256) for start in range(0, n, 256)]
+        work = lambda cols: stacked_quantile_threshold(E[:, cols].T, q)
+    elif mode == "tile":
+        bm, bn = tile_shape
+        chunks = [slice(start, start + bm) for start in range(0, m, bm)]
+        work = lambda rows: np.array([_select_quantile(np.array(E[rows, start:start + bn]).reshape(-1), q)
+                                      for start in range(0, n, bn)])
+    else:
+        raise ValueError(f"Unknown local quantile mode: {mode!r}")
+
+    if workers is None or workers <= 1 or len(chunks) == 1:
+        parts = [work(chunk) for chunk in chunks]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(work, chunks))
+    if mode == "tile":
+        return np.stack(parts)
+    return np.concatenate(parts)
+
+
+def local_mask(E, thresholds, mode, tile_shape=(256, 256), out=None):
+    '''
+    Boolean mask E <= threshold with the thresholds of local_thresholds.
+
+    Parameters:
+        E (np.ndarray): Residual magnitudes of shape (m, n).
+        thresholds (np.ndarray): Output of local_thresholds for the same mode and tile_shape.
+        mode (str): "row", "column" or "tile".
+        tile_shape (tuple): Tile shape for mode="tile".
+        out (np.ndarray): Optional boolean array of shape (m, n) to write into.
+
+    Returns:
+        M (np.ndarray): Boolean mask, True on the entries that are kept.
+    '''
+    if out is None:
+        out = np.empty(E.shape, dtype=bool)
+    if mode == "row":
+        np.less_equal(E, thresholds[:, None], out=out)
+    elif mode == "column":
+        np.less_equal(E, thresholds[None, :], out=out)
+    else:
+        # One row of per-column thresholds for each band of tiles.
+        bm, bn = tile_shape
+        for i, start in enumerate(range(0, E.shape[0], bm)):
+            band = np.repeat(thresholds[i], bn)[:E.shape[1]]
+            np.less_equal(E[start:start + bm], band, out=out[start:start + bm])
+    return out
+
+
+class QuantileSketch:
+    '''
+    Running quantile estimate over a stream of value batches, e.g. the residual magnitudes
+    of successive column batches in online QMU.
+
+    The sketch keeps a fixed-size uniform sample. Each batch contributes a uniform sample
+    of its own values, and older samples are thinned by the forgetting factor, so the
+    estimate follows a drifting distribution with memory that does not grow with the stream.
+
+    Parameters:
+        size (int): Number of retained samples; the rank error is about 1 / sqrt(size).
+        forgetting (float): Weight of the existing samples relative to a new batch of the same
+                            number of values (1 keeps the whole stream equally weighted).
+        rng (np.random.Generator): Generator for the sampling.
+    '''
+
+    def __init__(self, size=1 << 16, forgetting=1.0, rng=None):
+        self.size = size
+        self.forgetting = forgetting
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.samples = np.empty(0)
+        self.weight = 0.0
+
+    def update(self, values):
+        '''
+        Adds a batch of values (any shape) to the sketch.
+        '''
+        values = np.asarray(values).reshape(-1)
+        self.weight *= self.forgetting
+        total = self.weight + values.size
+
+        # Split the retained budget between old samples and the batch by their weights.
+        n_new = min(values.size, int(round(self.size * values.size / total)))
+        n_old = min(self.samples.size, self.size - n_new)
+        new = values[self.rng.choice(values.size, n_new, replace=False)]
+        old = self.samples[self.rng.choice(self.samples.size, n_old, replace=False)]
+        self.samples = np.concatenate([old, new])
+        self.weight = total
+
+    def quantile(self, q):
+        '''
+        Returns the current estimate of the q-quantile of the stream.
+        '''
+        if self.samples.size == 0:
+            raise ValueError("QuantileSketch is empty")
+        return _select_quantile(self.samples.copy(), q)
+
+
+def sample_size(tol, delta=1e-3):
+    '''
+    Number of uniform samples needed so that the empirical q-quantile has rank error at
+    most tol with probability at least 1 - delta (Dvoretzky-Kiefer-Wolfowitz inequality).
+    '''
+    return int(np.ceil(np.log(2 / delta) / (2 * tol**2)))
+
+
+def _select_quantile(a, q):
+    '''
+    Linear-interpolation quantile along the last axis of a, partitioning a in place.
+
+    Uses the same index and interpolation rules as np.quantile's default method.
+    '''
+    N = a.shape[-1]
+    virtual = q * (N - 1)
+    lo = int(np.floor(virtual))
+    hi = min(lo + 1, N - 1)
+    gamma = virtual - lo
+
+    a.partition([lo, hi] if hi != lo else lo, axis=-1)
+    return _interpolate(a[..., lo], a[..., hi], gamma)
+
+
+def _interpolate(below, above, gamma):
+    '''
+    Linear interpolation between neighbouring order statistics, written as in np.quantile.
+    '''
+    diff = above - below
+    if gamma >= 0.5:
+        return above - diff * (1 - gamma)
+    return below + diff * gamma
@@ -0,0 +1,160 @@
+import numpy as np
+from time import time
+
+from .common import RelativeErrorTracker
+from .quantile import stacked_quantile_threshold
+
+
+def nmf_restarts(X_ref, X_train, max_iter, r, num_restarts, seed=None):
+    """
+    Runs num_restarts random initializations of standard multiplicative updates NMF
+    side by side and returns the best one.
+
+    The K = num_restarts factor pairs are held as stacked arrays of shapes (K, m, r)
+    and (K, r, n). The products with the data are done for all restarts at once as a
+    single matrix product with K * r columns, and the r x r Gram products are batched
+    with np.matmul.
+
+    Parameters:
+        X_ref (np.ndarray): Data used for error measurement.
+        X_train (np.ndarray): Data used for training the model.
+        max_iter (int): Number of iterations.
+        r (int): Target rank for the factorization.
+        num_restarts (int): Number of random initializations K.
+        seed (int): Random number generator seed
+
+    Returns:
+        W (np.ndarray): Dictionary matrix of the best restart.
+        H (np.ndarray): Representation matrix of the best restart.
+        (None): For consistency with qmu_restarts, which returns the mask here.
+        errors (np.ndarray): Relative errors against X_ref, shape (K, max_iter + 1).
+        runtime (float): Runtime of algorithm, not including relative error measurements
+        best (int): Index of the best restart, the one with the smallest final ||X_train - W @ H||_F.
+    """
+    m, n = X_train.shape
+    K = num_restarts
+
+    if seed is not None:
+        np.random.seed(seed)
+
+    W = np.abs(np.random.randn(K, m, r))
+    H = np.abs(np.random.randn(K, r, n))
+
+    relative_error = RelativeErrorTracker(X_ref)
+    errors = [relative_error.batch(W, H)]
+    runtime = 0
+
+    for i in range(max_iter):
+        start_time = time()
+        epsilon = 1e-10
+
+        Ht = H.transpose(0, 2, 1)
+        W = W * (_data_times(X_train, H) / ((W @ (H @ Ht)) + epsilon))
+        Wt = W.transpose(0, 2, 1)
+        WtX = _times_data(W, X_train)
+        H = H * (WtX / (((Wt @ W) @ H) + epsilon))
+
+        runtime += time() - start_time
+        errors.append(relative_error.batch(W, H, WtX if X_ref is X_train else None))
+
+    if X_ref is X_train:
+        best = int(np.argmin(errors[-1]))
+    else:
+        best = int(np.argmin(RelativeErrorTracker(X_train).batch(W, H)))
+    return W[best], H[best], None, np.array(errors).T, runtime, best
+
+
+def qmu_restarts(D_tilde, D, max_iter, r, q, num_restarts, seed=None):
+    '''
+    Runs num_restarts random initializations of QMU side by side and returns the best one.
+
+    The K = num_restarts factor pairs are held as stacked arrays of shapes (K, m, r) and
+    (K, r, n), and each iteration forms the K residuals, quantile thresholds and masks
+    in single stacked operations. Memory is dominated by a few (K, m, n) arrays, so this
+    suits many restarts of small problems.
+
+    Parameters:
+        D_tilde (np.ndarray): Reference (uncorrupted) data used for error measurement.
+        D (np.ndarray): Input data (possibly corrupted) used for training the model.
+        max_iter (int): Number of iterations to run.
+        r (int): Target rank for the factorization.
+        q (float): Quantile threshold for masking (typically set to 1 - corruption_rate).
+        num_restarts (int): Number of random initializations K.
+        seed (int):  Random number generator seed
+
+    Returns:
+        W (np.ndarray): Dictionary matrix of the best restart.
+        H (np.ndarray): Representation matrix of the best restart.
+        M (np.ndarray): Final masking matrix of the best restart.
+        errors (np.ndarray): Relative errors against D_tilde, shape (K, max_iter + 1).
+        runtime (float): Runtime of algorithm, not including relative error measurements
+        best (int): Index of the best restart, the one whose final fit has the smallest sum of
+                    squared residuals over its q-quantile of best-fit entries (the objective
+                    QMU minimizes, which does not need the uncorrupted data).
+    '''
+    m, n = D.shape
+    K = num_restarts
+
+    if seed is not None:
+        np.random.seed(seed)
+
+    W = np.abs(np.random.randn(K, m, r))
+    H = np.abs(np.random.randn(K, r, n))
+
+    # Stacked (K, m, n) work arrays, reused every iteration.
+    WH = np.empty((K, m, n))
+    E = np.empty((K, m, n))
+    MD = np.empty((K, m, n))
+    M = np.empty((K, m, n), dtype=bool)
+
+    relative_error = RelativeErrorTracker(D_tilde)
+    errors = [relative_error.batch(W, H)]
+    runtime = 0
+
+    for i in range(max_iter):
+        start_time = time()
+        epsilon = 1e-10
+
+        # Stacked quantile masks, one threshold per restart.
+        np.matmul(W, H, out=WH)
+        np.subtract(D, WH, out=E)
+        np.abs(E, out=E)
+        np.less_equal(E, stacked_quantile_threshold(E, q)[:, None, None], out=M)
+        np.multiply(D, M, out=MD)
+
+        # Update rules for W and H
+        WH *= M
+        Ht = H.transpose(0, 2, 1)
+        W = W * ((MD @ Ht) / ((WH @ Ht) + epsilon))
+        np.matmul(W, H, out=WH)
+        WH *= M
+        Wt = W.transpose(0, 2, 1)
+        H = H * ((Wt @ MD) / ((Wt @ WH) + epsilon))
+
+        runtime += time() - start_time
+        errors.append(relative_error.batch(W, H))
+
+    # Trimmed squared residual of each final fit.
+    E = np.abs(D - W @ H)
+    keep = E <= stacked_quantile_threshold(E, q)[:, None, None]
+    best = int(np.argmin(np.einsum('kij,kij->k', E * keep, E)))
+    M = (np.abs(D - W[best] @ H[best]) <= stacked_quantile_threshold(E[best:best + 1], q)[0]).astype(np.float64)
+
+    return W[best], H[best], M, np.array(errors).T, runtime, best
+
+
+def _data_times(X, H):
+    '''
+    Stacked X @ H[k].T for all k, as one product of X with the K * r rows of H.
+    '''
+    K, r, n = H.shape
+    return (X @ H.reshape(K * r, n).T).reshape(-1, K, r).transpose(1, 0, 2)
+
+
+def _times_data(W, X):
+    '''
+    Stacked W[k].T @ X for all k, as one product of the K * r columns of W with X.
+    '''
+    K, m, r = W.shape
+    return (X.T @ W.transpose(1, 0, 2).reshape(m, K * r)).T.reshape(K, r, -1)
+
@@ -0,0 +1,172 @@
+"""
+On-disk store of experiment results, written as runs finish.
+
+A store is a directory holding one .npy file per finished run with its error curve and an
+index.jsonl file with one line per run: label, run number, seed, a description and digest
+of the experiment parameters, the runtime reported by the algorithm, the wall-clock time
+and the curve's file name. A curve is written (to a temporary file, then renamed) before
+its index line is appended, so an interrupted sweep leaves only complete entries behind.
+
+run_experiments(..., store=...) appends to a store and skips the (label, seed) cells it
+already holds when a sweep is resumed; plot_experiment accepts a store (or its directory)
+in place of the errors dict and loads the curves of one label at a time.
+
+Example:
+    run_experiments(10, 500, experiment, generate_synthetic_matrix, store="results/sweep")
+    plot_experiment(ResultsStore("results/sweep"), log_y_axis=True)
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.jsonl"
+
+
+class ResultsStore:
+    '''
+    Append-only store of per-run error curves, runtimes, seeds and parameters.
+
+    The store behaves like the errors dict of run_experiments: keys() lists the labels
+    and store[label] loads that label's curves as a (num_runs, T) array ordered by run.
+    If a label was recorded with different parameters, store[label] returns the runs of
+    the most recently recorded parameters.
+
+    Parameters:
+        directory (str): Directory of the store, created if missing.
+        dtype (np.dtype): Type the error curves are saved as, e.g. np.float32 to halve
+                          the size of the store.
+    '''
+
+    def __init__(self, directory, dtype=np.float64):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        self._entries = _read_index(os.path.join(directory, INDEX_FILE))
+
+    def append(self, label, run, seed, params, errors, runtime, wall=None):
+        '''
+        Saves the error curve of one finished run and records it in the index.
+
+        Parameters:
+            label (str): Experiment label.
+            run (int): Run number.
+            seed (str): Description of the seed the run was drawn under.
+            params (dict): Description of the run's parameters, see describe().
+            errors (list): Error curve returned by the algorithm.
+            runtime (float): Runtime returned by the algorithm.
+            wall (float): Optional wall-clock time of the run, including data generation.
+        '''
+        digest = params_digest(params)
+        name = hashlib.sha256(repr((label, seed, digest)).encode()).hexdigest()[:32] + ".npy"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(errors, dtype=self.dtype))
+        os.replace(tmp_path, path)
+
+        entry = {'label': label, 'run': int(run), 'seed': seed, 'digest': digest, 'params': params,
+                 'runtime': float(runtime), 'wall': None if wall is None else float(wall),
+                 'length': len(errors), 'file': name}
+        with open(os.path.join(self.directory, INDEX_FILE), 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        self._entries.append(entry)
+
+    def find(self, label, seed, params):
+        '''
+        Returns the index entry of the run recorded under label, seed and params, or None
+        if the store does not hold it.
+        '''
+        digest = params_digest(params)
+        for entry in reversed(self._entries):
+            if entry['label'] == label and entry['seed'] == seed and entry['digest'] == digest:
+                return entry
+        return None
+
+    def entries(self, label):
+        '''
+        Returns the index entries of label under its most recently recorded parameters,
+        one per run (the last one if a run was recorded twice), ordered by run.
+        '''
+        entries = [entry for entry in self._entries if entry['label'] == label]
+        if not entries:
+            raise KeyError(label)
+        digest = entries[-1]['digest']
+        by_run = {entry['run']: entry for entry in entries if entry['digest'] == digest}
+        return [by_run[run] for run in sorted(by_run)]
+
+    def keys(self):
+        '''
+        Returns the labels in the order they were first recorded.
+        '''
+        return list(dict.fromkeys(entry['label'] for entry in self._entries))
+
+    def load(self, entry):
+        '''
+        Loads the error curve of one index entry.
+        '''
+        return np.load(os.path.join(self.directory, entry['file']))
+
+    def __getitem__(self, label):
+        return np.array([self.load(entry) for entry in self.entries(label)])
+
+    def __contains__(self, label):
+        return any(entry['label'] == label for entry in self._entries)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def runtimes(self):
+        '''
+        Returns a dict mapping each label to the list of its runtimes, ordered by run.
+        '''
+        return {label: [entry['runtime'] for entry in self.entries(label)] for label in self.keys()}
+
+
+def describe(value):
+    '''
+    Returns a JSON-serializable description of an experiment parameter that is stable
+    across processes: functions and classes by their qualified name, containers
+    element-wise, arrays by a digest of their contents and other objects by their type.
+    '''
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return f"array{value.shape}:{hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()[:16]}"
+    if callable(value) and hasattr(value, '__qualname__'):
+        return f"{value.__module__}.{value.__qualname__}"
+    return f"<{type(value).__module__}.{type(value).__qualname__}>"
+
+
+def params_digest(params):
+    '''
+    Hex digest of a parameter description returned by describe().
+    '''
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_index(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb+') as f:
+        # Terminate a line cut short by an interruption so the next entry starts on its own line.
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A line cut short by an interruption; its run is simply redone.
+                continue
+    return entries
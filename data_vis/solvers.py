@@ -0,0 +1,197 @@
+"""
+Faster-converging alternatives to the plain multiplicative updates, used by
+nmf(..., solver=...) and qmu(..., solver=...).
+
+With the QMU mask M, each iteration minimizes a majorizer of the masked objective
+||M * (D - WH)||_F^2: the excluded entries of D are replaced by the current product,
+    X = M * D + (1 - M) * WH,
+which has the same value and gradient at the current iterate, so any decrease of
+||X - WH||_F^2 also decreases the masked objective. X is unmasked, so the updates work
+on the products X H^T, W^T X and the r x r Gram matrices W^T W, H H^T, and several
+inner updates can reuse them at O((m + n) r^2) cost each instead of O(m n r). For NMF
+X is the data itself.
+
+Solvers:
+    "amu": accelerated multiplicative updates, `inner` MU updates per factor.
+    "hals": hierarchical alternating least squares, `inner` column-wise coordinate
+            descent sweeps per factor.
+    "amu_nesterov", "hals_nesterov": the above with extrapolated factors, where the
+            extrapolation weight grows while the objective decreases and is reset when
+            it increases. For QMU both objectives are taken under the mask of the current
+            iteration, so a refreshed mask never triggers a restart by itself.
+"""
+import numpy as np
+from time import time
+
+from .common import RelativeErrorTracker
+from .qmu import residual_mask
+from .observers import notify
+
+SOLVERS = ("mu", "amu", "hals", "amu_nesterov", "hals_nesterov")
+DEFAULT_INNER = {"amu": 5, "hals": 3}
+# Upper bound of the extrapolation weight. The objective rarely increases once the weight
+# is large, so the restarts seldom fire, and a weight of 1 slows the final iterations.
+BETA_CAP = 0.9
+
+
+def _mu_W(W, XHt, HHt, inner, epsilon):
+    for _ in range(inner):
+        W = W * (XHt / (W @ HHt + epsilon))
+    return W
+
+
+def _mu_H(H, WtX, WtW, inner, epsilon):
+    for _ in range(inner):
+        H = H * (WtX / (WtW @ H + epsilon))
+    return H
+
+
+def _hals_W(W, XHt, HHt, inner, epsilon):
+    W = W.copy()
+    for _ in range(inner):
+        for k in range(W.shape[1]):
+            W[:, k] = np.maximum(W[:, k] + (XHt[:, k] - W @ HHt[:, k]) / (HHt[k, k] + epsilon), epsilon)
+    return W
+
+
+def _hals_H(H, WtX, WtW, inner, epsilon):
+    H = H.copy()
+    for _ in range(inner):
+        for k in range(H.shape[0]):
+            H[k] = np.maximum(H[k] + (WtX[k] - WtW[k] @ H) / (WtW[k, k] + epsilon), epsilon)
+    return H
+
+
+def _masked_objective(M, D, WH):
+    R = M * (D - WH)
+    return np.vdot(R, R)
+
+
+UPDATES = {"amu": (_mu_W, _mu_H), "hals": (_hals_W, _hals_H)}
+
+
+def run_solver(X_ref, D, W, H, max_iter, solver, q=None, inner=None, quantile_method="exact", quantile_tol=0.01,
+               rng=None, reconstructions=None, stopping=None, callbacks=(), profiler=None, mask_mode="global",
+               tile_shape=None, mask_every=1, quantile_workers=None):
+    """
+    Runs one of the SOLVERS other than "mu" for NMF (q=None) or QMU.
+
+    Parameters:
+        X_ref (np.ndarray): Data used for error measurement.
+        D (np.ndarray): Training data. May be a scipy.sparse matrix for NMF.
+        W (np.ndarray): Initial dictionary matrix.
+        H (np.ndarray): Initial representation matrix.
+        max_iter (int): Number of outer iterations.
+        solver (str): Solver name, see the module docstring.
+        q (float): Quantile level of the QMU mask, or None for NMF.
+        inner (int): Inner updates per factor and outer iteration. Defaults to
+                     DEFAULT_INNER of the solver.
+        quantile_method (str): Threshold method, see quantile.quantile_threshold.
+        quantile_tol (float): Rank error bound for quantile_method="sample".
+        rng (np.random.Generator): Generator for quantile_method="sample".
+        reconstructions (ReconstructionHistory): History to record into.
+        stopping (StoppingCriteria): Optional early stopping criteria.
+        callbacks (tuple): Iteration callbacks, see observers.py.
+        profiler (PhaseTimer): Optional phase timer.
+        mask_mode, tile_shape, mask_every, quantile_workers: Mask options, see qmu.
+
+    Returns:
+        The same values as nmf and qmu; M is None for NMF.
+    """
+    base = solver.replace("_nesterov", "")
+    if base not in UPDATES:
+        raise ValueError(f"Unknown solver: {solver!r}")
+    update_W, update_H = UPDATES[base]
+    inner = DEFAULT_INNER[base] if inner is None else inner
+    extrapolate = solver.endswith("_nesterov")
+    epsilon = 1e-10
+
+    # Rescale the initialization to the least-squares scale of the data,
+    # argmin_a ||D - a WH||_F. The random start is far too large for data in [0, 1]
+    # (e.g. Swimmer), and the fast solvers would otherwise impute the entries the first
+    # mask excludes from that overshoot and keep them excluded.
+    W = W * (np.vdot((D.T @ W).T, H) / (np.vdot(W.T @ W, H @ H.T) + epsilon))
+
+    relative_error = RelativeErrorTracker(X_ref)
+    errors = [relative_error(W, H)]
+    reconstructions.record(0, W, H)
+    runtime = 0
+    M = None
+
+    # Extrapolation state (Ang and Gillis, 2019): W_y, H_y are the extrapolated points
+    # the updates start from, beta the current weight and beta_max its cap.
+    W_y, H_y = W, H
+    beta, beta_max = 0.5, BETA_CAP
+    previous_objective = np.inf
+    WH_new = None
+
+    for i in range(max_iter):
+        start_time = time()
+        if profiler is not None:
+            profiler.start()
+
+        # Target of this iteration: the data, or the data with its excluded entries imputed.
+        if q is None:
+            X = D
+        else:
+            WH = W @ H if WH_new is None else WH_new
+            if i % mask_every == 0:
+                M = residual_mask(np.abs(D - WH), q, mask_mode, quantile_method, quantile_tol, rng, tile_shape,
+                                  quantile_workers, profiler=profiler)
+            X = np.where(M > 0, D, WH)
+            if profiler is not None:
+                profiler.lap("mask")
+
+        XHt = X @ H_y.T
+        W_new = update_W(W_y, XHt, H_y @ H_y.T, inner, epsilon)
+        if profiler is not None:
+            profiler.lap("W")
+        WtX = (X.T @ W_new).T
+        WtW = W_new.T @ W_new
+        H_new = update_H(H_y, WtX, WtW, inner, epsilon)
+        if profiler is not None:
+            profiler.lap("H")
+
+        if extrapolate:
+            if q is None:
+                # ||D - WH||^2 - ||D||^2 from products already at hand.
+                objective = np.vdot(WtW, H_new @ H_new.T) - 2 * np.vdot(WtX, H_new)
+            else:
+                # The masked objective of the previous and the new iterate under this
+                # iteration's mask, so that a refreshed mask is never compared with the
+                # one before it. The new product is reused by the next iteration.
+                previous_objective = _masked_objective(M, D, WH)
+                WH_new = W_new @ H_new
+                objective = _masked_objective(M, D, WH_new)
+            if objective <= previous_objective:
+                beta = min(beta_max, 1.05 * beta)
+                beta_max = min(BETA_CAP, 1.01 * beta_max)
+                # Entries the step would make nonpositive keep their plain value: a small
+                # floor instead would leave them stuck near zero under multiplicative updates.
+                W_y = W_new + beta * (W_new - W)
+                W_y = np.where(W_y > 0, W_y, W_new)
+                H_y = H_new + beta * (H_new - H)
+                H_y = np.where(H_y > 0, H_y, H_new)
+            else:
+                # Restart from the plain iterate with a smaller weight.
+                beta_max = beta
+                beta = beta / 1.5
+                W_y, H_y = W_new, H_new
+            previous_objective = objective
+        else:
+            W_y, H_y = W_new, H_new
+        W, H = W_new, H_new
+
+        runtime += time() - start_time
+        errors.append(relative_error(W, H))
+        if profiler is not None:
+            profiler.lap("error")
+        reconstructions.record(i + 1, W, H)
+        if callbacks and notify(callbacks, i + 1, W, H, M, profiler.timings):
+            break
+        if stopping is not None and stopping.update(i + 1, errors, mask=M if i % mask_every == 0 else None):
+            break
+
+    if profiler is not None:
+        profiler.stop()
+    return W, H, M, errors, runtime, reconstructions
@@ -0,0 +1,104 @@
+import numpy as np
+from time import time
+
+
+class StoppingCriteria:
+    '''
+    Convergence-based early stopping for nmf and qmu.
+
+    The criteria only reuse quantities the algorithms already have: the relative error
+    appended every iteration and, for QMU, the current mask. After a run, `reason` and
+    `iteration` tell why and when it stopped.
+
+    Parameters:
+        tol (float): Stop once the relative change of the error, |e_i - e_{i-1}| / e_{i-1},
+                     stays below tol for `patience` consecutive iterations.
+        patience (int): Number of consecutive iterations the error criterion must hold.
+        mask_tol (float): QMU only: stop once the fraction of mask entries that changed since
+                          the previous check is at most mask_tol (0 means an identical mask).
+                          The "blocked" engine, which never stores the mask, raises ValueError.
+        max_time (float): Stop once this many seconds of wall-clock time have passed since
+                          the start of the run.
+        min_iter (int): Never stop before this iteration.
+        check_every (int): Compare only every check_every-th mask. Masks are counted as they
+                           are recomputed, i.e. every mask_every iterations of the run.
+
+    Attributes:
+        reason (str): "tol", "mask", "time", or "max_iter" if no criterion fired.
+        iteration (int): Number of iterations that were run.
+    '''
+
+    def __init__(self, tol=None, patience=1, mask_tol=None, max_time=None, min_iter=0, check_every=1):
+        self.tol = tol
+        self.patience = patience
+        self.mask_tol = mask_tol
+        self.max_time = max_time
+        self.min_iter = min_iter
+        self.check_every = check_every
+        self.start(0)
+
+    def start(self, max_iter):
+        '''
+        Resets the criteria before a run of at most max_iter iterations.
+        '''
+        self.max_iter = max_iter
+        self.reason = None
+        self.iteration = 0
+        self._start_time = time()
+        self._streak = 0
+        self._previous_mask = None
+        self._masks = 0
+
+    def update(self, iteration, errors, mask=None, excluded=None, size=None):
+        '''
+        Checks the criteria after an iteration and returns True if the run should stop.
+
+        Parameters:
+            iteration (int): Number of completed iterations.
+            errors (list): Relative errors so far, the last one belonging to this iteration.
+            mask (np.ndarray): Dense mask, if the algorithm recomputed it in this iteration.
+            excluded (np.ndarray): The recomputed mask as the sorted flat indices of its
+                                   excluded entries, for engines that store it that way.
+            size (int): Total number of mask entries, required with excluded.
+        '''
+        self.iteration = iteration
+        reason = None
+
+        if self.tol is not None and len(errors) > 1:
+            change = abs(errors[-1] - errors[-2]) / (abs(errors[-2]) + 1e-10)
+            self._streak = self._streak + 1 if change < self.tol else 0
+            if self._streak >= self.patience:
+                reason = "tol"
+
+        # A mask reused between refreshes is not compared, as it is trivially unchanged.
+        current = mask if mask is not None else excluded
+        if self.mask_tol is not None and current is not None:
+            self._masks += 1
+            if self._masks % self.check_every == 0:
+                if self._previous_mask is not None and reason is None:
+                    if mask is not None:
+                        changed = np.count_nonzero(self._previous_mask != mask) / mask.size
+                    else:
+                        changed = np.setxor1d(self._previous_mask, excluded, assume_unique=True).size / size
+                    if changed <= self.mask_tol:
+                        reason = "mask"
+                self._previous_mask = current.copy()
+
+        if reason is None and self.max_time is not None and time() - self._start_time >= self.max_time:
+            reason = "time"
+
+        if reason is not None and iteration >= self.min_iter:
+            self.reason = reason
+            return True
+        if iteration >= self.max_iter:
+            self.reason = "max_iter"
+        return False
+
+
+def make_stopping(stopping, max_iter):
+    '''
+    Resolves the stopping argument of nmf/qmu; None disables early stopping.
+    '''
+    if stopping is not None:
+        stopping.start(max_iter)
+    return stopping
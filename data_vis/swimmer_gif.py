@@ -1,39 +1,110 @@
-import matplotlib
-matplotlib.use('Agg')  # non-interactive backend
+"""
+Renders GIFs of the NMF and QMU reconstructions of one Swimmer image over the iterations.
+
+Frames are drawn directly as palette images: every reconstruction is mapped through a
+precomputed plasma lookup table under a shared LogNorm, upsampled to the output size with
+np.repeat, and labelled from a cache of pre-rendered glyphs. No matplotlib figure is created.
+Frames are rendered in a thread pool and written to the GIF one at a time, so no list of
+frames is kept.
+Matplotlib (for the colormap and font) and Pillow are imported on first use.
+
+Example:
+    python -m data_vis.swimmer_gif --max-iter 400 --rank 17 --column 17
+"""
+import argparse
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import imageio
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
 
-from data_gen import load_swimmer_dataset
-from nmf import nmf
-from qmu import qmu
+from .data_gen import load_swimmer_dataset
+from .nmf import nmf
+from .qmu import qmu
+from .history import ReconstructionHistory
 
-np.random.seed(1)
+IMAGE_SHAPE = (11, 20)
+LABEL_COLOR = 255  # palette index of the label, the rest hold the colormap
 
-# Load the dataset
-D, D_tilde = load_swimmer_dataset(beta=0.05, corruption_scale=5)
 
-# Run algorithms and get reconstruction histories
-_, _, _, _, _, recs_nmf = nmf(D_tilde, D, max_iter=400, r=17, seed=42)
-_, _, _, _, _, recs_qmu = qmu(D_tilde, D, max_iter=400, r=17, q=0.95, seed=42)
+def make_gif(recs, out_path, total_duration=None, speedup_factor=8, column=17, scale=50, workers=None):
+    """
+    Builds a GIF from reconstruction history with exponential timing and clamped tail durations.
 
-def make_gif(recs, out_path, total_duration=None, speedup_factor=8):
-    """Builds a GIF from reconstruction history with exponential timing and clamped tail durations."""
+    Parameters:
+        recs (list): Reconstructions (e.g. a ReconstructionHistory); column `column` of
+                     each is reshaped to an 11 x 20 Swimmer image.
+        out_path (str): Path of the GIF file to write.
+        total_duration (float): Total GIF time in seconds. Defaults to len(recs) / 10.
+        speedup_factor (float): Rate of the exponential decay of the frame durations.
+        column (int): Column of the reconstructions to render. Use 0 for a history that
+                      keeps only the rendered image's column.
+        scale (int): Output pixels per image pixel (50 gives 1000 x 550 frames).
+        workers (int): Rendering threads. Defaults to the number of CPUs.
+    """
     eps = 1e-1
-    # extract and reshape column 17
-    mats = [(rec[:, 17].reshape(11, 20) + eps) for rec in recs]
+    # extract and reshape the image column
+    mats = [(rec[:, column].reshape(IMAGE_SHAPE) + eps) for rec in recs]
 
     # shared log-normalization
     vmin = min(M.min() for M in mats)
     vmax = max(M.max() for M in mats)
-    norm = colors.LogNorm(vmin=vmin, vmax=vmax)
 
-    # timing schedule
-    n = len(mats)
+    palette = _palette('plasma', LABEL_COLOR)
+    glyphs = GlyphCache(font_size=32 / 72 * 100 * scale / 50)
+    durations_ms = _frame_durations(len(mats), total_duration, speedup_factor)
+
+    from PIL import Image
+
+    def render(item):
+        idx, M = item
+        frame = np.repeat(np.repeat(_lut_indices(M, vmin, vmax, LABEL_COLOR), scale, axis=0), scale, axis=1)
+        # iteration label starting at 0
+        height, width = frame.shape
+        glyphs.draw(frame, f"Iter {idx}", int(0.035 * width), int(0.05 * height), LABEL_COLOR)
+        image = Image.fromarray(frame, mode='P')
+        image.putpalette(palette)
+        return image
+
+    frames = _ordered_map(render, enumerate(mats), workers or os.cpu_count() or 1)
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    _write_gif(out_path, frames, durations_ms)
+    print(f"Wrote {out_path}")
+
+
+def _write_gif(out_path, frames, durations_ms):
+    """
+    Writes palette frames sharing one palette to a looping GIF, encoding each frame as it
+    arrives. Every frame after the first only stores the box where it differs from the
+    previous one, so the encoder holds at most two frames.
+    """
+    from PIL import GifImagePlugin
+
+    previous = None
+    with open(out_path, "wb") as f:
+        for frame, duration in zip(frames, durations_ms):
+            current = np.asarray(frame)
+            box = (0, 0) + frame.size
+            if previous is None:
+                header, _ = GifImagePlugin.getheader(frame, info={'loop': 0})
+                f.write(b"".join(header))
+            else:
+                changed = current != previous
+                rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+                # an unchanged frame still needs one pixel to carry its duration
+                box = (cols[0], rows[0], cols[-1] + 1, rows[-1] + 1) if rows.size else (0, 0, 1, 1)
+            f.write(b"".join(GifImagePlugin.getdata(frame.crop(box), offset=box[:2], duration=duration)))
+            previous = current
+        f.write(b";")  # trailer
+
+
+def _frame_durations(n, total_duration=None, speedup_factor=8):
+    """
+    Exponentially decaying frame durations in ms, constant after frame 150.
+    """
     total_duration = total_duration or (n / 10)  # total GIF time in seconds
-    raw = np.exp(-speedup_factor * np.arange(n) / (n - 1))
+    raw = np.exp(-speedup_factor * np.arange(n) / max(n - 1, 1))
     secs = raw / raw.sum() * total_duration
     durations_ms = [max(1, int(s * 1000)) for s in secs]
     # clamp durations after iteration 150
@@ -41,35 +112,121 @@ def make_gif(recs, out_path, total_duration=None, speedup_factor=8):
         clamp = durations_ms[150]
         for j in range(150, len(durations_ms)):
             durations_ms[j] = clamp
+    return durations_ms
 
-    frames = []
-    for idx, M in enumerate(mats):
-        # full-frame image matching data aspect ratio
-        fig = plt.figure(figsize=(10, 5.5), dpi=100)
-        ax = fig.add_axes([0, 0, 1, 1])
-        ax.imshow(M, cmap='plasma', norm=norm, aspect='equal')
-        ax.axis('off')
 
-        # iteration label starting at 0
-        ax.text(
-            0.035, 0.95, f"Iter {idx}",
-            transform=ax.transAxes,
-            fontsize=32, fontweight='bold', fontfamily='sans-serif',
-            color='white', verticalalignment='top', horizontalalignment='left'
-        )
-
-        # render to RGBA buffer and extract RGB channels correctly
-        buf, (w, h) = fig.canvas.print_to_buffer()
-        img = np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 4)
-        rgb = img[:, :, :3]  # take R, G, B channels
-        frames.append(rgb)
-        plt.close(fig)
-
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    imageio.mimsave(out_path, frames, duration=durations_ms)
-    print(f"Wrote {out_path}")
+def _palette(cmap, levels):
+    """
+    GIF palette with the first `levels` entries sampled from cmap and white after them.
+    """
+    from matplotlib import colormaps
+
+    colors = colormaps[cmap].resampled(levels)(np.arange(levels))[:, :3]
+    rgb = np.vstack([np.round(colors * 255), np.full((256 - levels, 3), 255)])
+    return rgb.astype(np.uint8).ravel().tolist()
+
+
+def _lut_indices(M, vmin, vmax, levels):
+    """
+    Palette indices of M under LogNorm(vmin, vmax), binned like a matplotlib colormap.
+    """
+    t = (np.log(M) - np.log(vmin)) / (np.log(vmax) - np.log(vmin))
+    return np.clip((t * levels).astype(int), 0, levels - 1).astype(np.uint8)
+
+
+def _ordered_map(func, items, workers):
+    """
+    Yields func(item) in order, running at most 2 * workers calls ahead of the consumer.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class GlyphCache:
+    '''
+    Draws labels by stamping pre-rendered character masks into palette frames.
+
+    Each character is rasterized once with the bold sans-serif font matplotlib would use and
+    then reused for every frame. Characters are placed by their advance widths.
+
+    Parameters:
+        font_size (float): Font size in pixels.
+    '''
+
+    def __init__(self, font_size):
+        from matplotlib import font_manager
+        from PIL import ImageFont
+
+        path = font_manager.findfont(font_manager.FontProperties(family='sans-serif', weight='bold'))
+        self.font = ImageFont.truetype(path, size=max(1, int(round(font_size))))
+        self.glyphs = {}
+
+    def glyph(self, char):
+        '''
+        Returns (mask, x offset, y offset, advance) of char, rendering it on first use.
+        '''
+        if char not in self.glyphs:
+            from PIL import Image, ImageDraw
+
+            left, top, right, bottom = self.font.getbbox(char)
+            image = Image.new('L', (max(right, 1), max(bottom, 1)))
+            ImageDraw.Draw(image).text((0, 0), char, font=self.font, fill=255)
+            mask = np.asarray(image)[top:bottom, left:right] >= 128
+            self.glyphs[char] = (mask, left, top, self.font.getlength(char))
+        return self.glyphs[char]
+
+    def draw(self, frame, text, x, y, color):
+        '''
+        Writes text into frame (a 2-D palette index array) with its top-left corner at (x, y).
+        '''
+        pen = float(x)
+        for char in text:
+            mask, left, top, advance = self.glyph(char)
+            row, col = y + top, int(pen) + left
+            region = frame[row:row + mask.shape[0], col:col + mask.shape[1]]
+            region[mask[:region.shape[0], :region.shape[1]]] = color
+            pen += advance
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render GIFs of NMF and QMU reconstructions of a Swimmer image.")
+    parser.add_argument("--max-iter", type=int, default=400)
+    parser.add_argument("--rank", type=int, default=17)
+    parser.add_argument("--q", type=float, default=0.95)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--corruption-scale", type=float, default=5)
+    parser.add_argument("--column", type=int, default=17, help="Swimmer image to render")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--speedup", type=float, default=8)
+    parser.add_argument("--scale", type=int, default=50)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--path", help="Swimmer.mat to load instead of the packaged copy")
+    parser.add_argument("--out-dir", default="gifs", help="output directory, relative to the working directory")
+    args = parser.parse_args(argv)
+
+    np.random.seed(1)
+
+    # Load the dataset
+    D, D_tilde = load_swimmer_dataset(beta=args.beta, corruption_scale=args.corruption_scale, path=args.path)
+
+    # Run algorithms and get reconstruction histories (only the rendered image is kept)
+    _, _, _, _, _, recs_nmf = nmf(D_tilde, D, max_iter=args.max_iter, r=args.rank, seed=args.seed,
+                                  history=ReconstructionHistory(columns=[args.column]))
+    _, _, _, _, _, recs_qmu = qmu(D_tilde, D, max_iter=args.max_iter, r=args.rank, q=args.q, seed=args.seed,
+                                  history=ReconstructionHistory(columns=[args.column]))
+
+    # Generate whitespace-free, exponentially-timed GIFs with plasma cmap. The histories
+    # keep only the rendered column, which is their column 0.
+    for name, recs in (("nmf", recs_nmf), ("qmu", recs_qmu)):
+        make_gif(recs, os.path.join(args.out_dir, f"{name}_reconstruction.gif"), speedup_factor=args.speedup,
+                 column=0, scale=args.scale, workers=args.workers)
 
-# Generate whitespace-free, exponentially-timed GIFs with plasma cmap
-make_gif(recs_nmf, "data_vis/gifs/nmf_reconstruction.gif", speedup_factor=8)
-make_gif(recs_qmu, "data_vis/gifs/qmu_reconstruction.gif", speedup_factor=8)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Successive-halving search over the rank r and quantile level q of qmu.
+
+Every candidate (r, q) is fitted on the same data with a random set of entries held out.
+All candidates first run a few iterations; they are then scored on the held-out entries,
+and only the best 1 / eta of them continue, from where they stopped, for eta times as many
+iterations in total. This repeats until one candidate is left (or max_iter is reached),
+so most of the budget goes to the promising configurations.
+
+The held-out entries include corrupted ones, so the score is a trimmed error: the held-out
+squared residuals are sorted and only the smallest score_q fraction is summed. The same
+entries and the same fraction are used for every candidate, so the scores are comparable
+across q.
+
+Example:
+    python -m data_vis.tuner --ranks 10 17 25 --qs 0.9 0.95 0.99 --beta 0.05
+"""
+import argparse
+import itertools
+from time import perf_counter
+
+import numpy as np
+
+from .data_gen import sample_support, generate_synthetic_matrix, load_swimmer_dataset
+from .qmu import product_entries, masked_update_W, masked_update_H, residual_mask
+
+
+def tune_qmu(D, ranks, qs, min_iter=10, max_iter=None, eta=3, holdout=0.05, score_q=None, seed=None,
+             quantile_method="exact", dtype=np.float64):
+    """
+    Searches the grid of ranks and quantile levels for qmu with successive halving.
+
+    The data, the held-out split and the scaled random initialization of each rank are
+    computed once and shared by all candidates; the survivors of each rung are
+    warm-started from their factors of the previous rung.
+
+    Parameters:
+        D (np.ndarray): Input data (possibly corrupted).
+        ranks (list): Candidate ranks r.
+        qs (list): Candidate quantile levels q.
+        min_iter (int): Iterations of every candidate in the first rung.
+        max_iter (int): Cap on the iterations of a candidate. Defaults to no cap.
+        eta (int): Factor by which the candidates are reduced and the iterations grown
+                   from one rung to the next.
+        holdout (float): Fraction of the entries of D held out for scoring.
+        score_q (float): Fraction of the held-out entries the score keeps. Defaults to min(qs).
+        seed (int): Seed of the held-out split and the initialization.
+        quantile_method (str): Threshold method, see quantile.quantile_threshold.
+        dtype (np.dtype): Floating point type of the fits.
+
+    Returns:
+        best (dict): 'r', 'q', 'score' and 'iterations' of the best candidate.
+        W (np.ndarray): Dictionary matrix of the best candidate (fitted without the
+                        held-out entries).
+        H (np.ndarray): Representation matrix of the best candidate.
+        trials (list): One dict per candidate and rung with 'rung', 'r', 'q', 'iterations',
+                       'score' and 'time' (seconds spent in that rung).
+    """
+    rng = np.random.default_rng(seed)
+    D = np.asarray(D, dtype=dtype)
+    m, n = D.shape
+    score_q = min(qs) if score_q is None else score_q
+
+    # Held-out entries, excluded from every fit.
+    held = sample_support(D.size, max(1, int(round(holdout * D.size))), rng)
+    rows, cols = np.divmod(held, n)
+    train = np.ones(D.shape, dtype=bool)
+    train.flat[held] = False
+    D_held = D.flat[held]
+    held_norm = np.vdot(D_held, D_held)
+    buffer = np.empty_like(D)
+
+    # One initialization per rank, shared by all its quantile levels.
+    D_train = D * train
+    init = {}
+    for r in ranks:
+        W = np.abs(rng.standard_normal((m, r))).astype(dtype)
+        H = np.abs(rng.standard_normal((r, n))).astype(dtype)
+        # Least-squares scale of the data, as in solvers.run_solver.
+        init[r] = (W * (np.vdot(D_train @ H.T, W) / (np.vdot(W.T @ W, H @ H.T) + 1e-10)), H)
+
+    def score(W, H):
+        residuals = np.sort((D_held - product_entries(W, H, rows, cols)) ** 2)
+        return float(residuals[:max(1, int(score_q * len(residuals)))].sum() / held_norm)
+
+    candidates = list(itertools.product(ranks, qs))
+    state = {(r, q): init[r] + (0,) for r, q in candidates}
+    scores = {}
+    trials = []
+    budget = min_iter if max_iter is None else min(min_iter, max_iter)
+    rung = 0
+    while True:
+        for r, q in candidates:
+            W, H, done = state[r, q]
+            start_time = perf_counter()
+            W, H = _fit(D, train, W, H, q, budget - done, quantile_method, rng, buffer)
+            state[r, q] = (W, H, budget)
+            scores[r, q] = score(W, H)
+            trials.append({'rung': rung, 'r': r, 'q': q, 'iterations': budget, 'score': scores[r, q],
+                           'time': perf_counter() - start_time})
+        if len(candidates) == 1 or (max_iter is not None and budget >= max_iter):
+            break
+        candidates = sorted(candidates, key=scores.get)[:max(1, len(candidates) // eta)]
+        budget = budget * eta if max_iter is None else min(budget * eta, max_iter)
+        rung += 1
+
+    r, q = min(candidates, key=scores.get)
+    W, H, iterations = state[r, q]
+    best = {'r': r, 'q': q, 'score': scores[r, q], 'iterations': iterations}
+    return best, W, H, trials
+
+
+def _fit(D, train, W, H, q, iterations, quantile_method, rng, buffer):
+    """
+    Runs iterations of qmu's updates on the entries of D where train is True.
+
+    The held-out entries get an infinite residual, so they sort above every training
+    entry and never enter the mask; the quantile level is rescaled so that the threshold
+    is the q-quantile of the training residuals.
+    """
+    N, N_train = D.size, np.count_nonzero(train)
+    q_all = q * (N_train - 1) / (N - 1)
+    for _ in range(iterations):
+        WH = W @ H
+        E = np.abs(D - WH)
+        E[~train] = np.inf
+        M = residual_mask(E, q_all, quantile_method=quantile_method, rng=rng, buffer=buffer)
+        MD = M * D
+        W = masked_update_W(W, H, M, MD, WH)
+        H = masked_update_H(W, H, M, MD)
+    return W, H
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Successive-halving search of the rank and quantile level of qmu.")
+    parser.add_argument("--dataset", choices=["synthetic", "swimmer"], default="swimmer")
+    parser.add_argument("--size", default="500x300", help="synthetic shape as MxN")
+    parser.add_argument("--true-rank", type=int, default=10, help="rank of the synthetic data")
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--ranks", nargs="+", type=int, default=[10, 17, 25])
+    parser.add_argument("--qs", nargs="+", type=float, default=[0.9, 0.95, 0.99])
+    parser.add_argument("--min-iter", type=int, default=10)
+    parser.add_argument("--max-iter", type=int)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--holdout", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--path", help="Swimmer.mat to load instead of the packaged copy")
+    args = parser.parse_args(argv)
+
+    np.random.seed(args.seed)
+    if args.dataset == "synthetic":
+        m, n = (int(k) for k in args.size.lower().split("x"))
+        D, _ = generate_synthetic_matrix(m, n, args.true_rank, beta=args.beta)
+    else:
+        D, _ = load_swimmer_dataset(beta=args.beta, path=args.path)
+
+    best, _, _, trials = tune_qmu(D, args.ranks, args.qs, args.min_iter, args.max_iter, args.eta, args.holdout,
+                                  seed=args.seed)
+    for trial in trials:
+        print(f"rung {trial['rung']}: r={trial['r']} q={trial['q']:.2f} {trial['iterations']} it "
+              f"score {trial['score']:.4g} ({trial['time']:.2f}s)")
+    spent = sum(trial['iterations'] - previous for trial, previous in _increments(trials))
+    grid = len(args.ranks) * len(args.qs) * best['iterations']
+    print(f"best: r={best['r']} q={best['q']:.2f} score {best['score']:.4g}; "
+          f"{spent} iterations against {grid} for the full grid")
+    return 0
+
+
+def _increments(trials):
+    """
+    Pairs each trial with the iterations its candidate had already run before it.
+    """
+    done = {}
+    for trial in trials:
+        key = (trial['r'], trial['q'])
+        yield trial, done.get(key, 0)
+        done[key] = trial['iterations']
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())